@@ -0,0 +1,315 @@
+# Load test and micro-benchmark for the API.
+#
+# Seeds a dedicated SQLite database, drives the endpoints (reads, ?stream=1 exports,
+# /stats, /changes, /batch and the writes: POST, PUT, PATCH, DELETE, favorites) through
+# the Flask test client and through a real WSGI server with concurrent clients, and
+# reports throughput and p50/p95/p99 latency per route. Routes that delete a row
+# create it first, outside the timed request (their req/s still includes it).
+# Requests are sent without Accept-Encoding, so the exports run the live query
+# rather than the gzip snapshots.
+#
+#   python benchmarks/load_test.py run --rows 10000 --requests 500 --concurrency 8 --output before.json
+#   python benchmarks/load_test.py run --rows 10000 --server gunicorn --workers 4 --output after.json
+#   python benchmarks/load_test.py compare before.json after.json --threshold 0.10
+#
+# compare exits with status 1 when a route's p95 latency or throughput regressed by
+# more than the threshold.
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+
+def seed(app, db, rows, batch_size=10000):
+    from models import User, People, Planet, Starship, Vehicle, Favorite
+
+    generators = {
+        People: lambda i: {"name": "Person %d" % i, "gender": ("male", "female", "n/a")[i % 3],
+                           "birth_year": "%dBBY" % (i % 100), "height": str(150 + i % 50),
+                           "mass": str(50 + i % 40), "homeworld": "Planet %d" % (i % 1000)},
+        Planet: lambda i: {"name": "Planet %d" % i, "climate": ("arid", "temperate", "frozen")[i % 3],
+                           "population": str(i * 1000), "terrain": ("desert", "forest", "ocean")[i % 3],
+                           "gravity": "1 standard"},
+        Starship: lambda i: {"name": "Starship %d" % i, "model": "Model %d" % (i % 50),
+                             "manufacturer": ("Incom", "Kuat", "Sienar")[i % 3],
+                             "starship_class": "Starfighter", "hyperdrive_rating": str(i % 5)},
+        Vehicle: lambda i: {"name": "Vehicle %d" % i, "model": "Model %d" % (i % 50),
+                            "manufacturer": ("Incom", "Aratech", "Ubrikkian")[i % 3],
+                            "cost_in_credits": str(i * 10), "max_atmosphering_speed": str(100 + i % 900)},
+    }
+    with app.app_context():
+        db.create_all()
+        if People.query.count() >= rows:
+            return
+        db.drop_all()
+        db.create_all()
+        for model, generate in generators.items():
+            for start in range(0, rows, batch_size):
+                db.session.execute(db.insert(model), [generate(i) for i in range(start, min(start + batch_size, rows))])
+                db.session.commit()
+            print("seeded %d %s rows" % (rows, model.__tablename__), file=sys.stderr)
+        db.session.add(User(email="bench@example.com", password="bench", is_active=True))
+        db.session.commit()
+        db.session.execute(db.insert(Favorite), [
+            {"user_id": 1, "planet_id": i} for i in range(1, min(rows, 50) + 1)
+        ])
+        db.session.commit()
+
+
+def routes(rows):
+    def any_id():
+        return random.randint(1, rows)
+
+    def bench_name():
+        return "Bench %d" % random.randint(0, 10 ** 9)
+
+    # Untimed setup for the deletes: the id of a new planet, or of a people row that
+    # is now a favorite of user 1
+    def new_planet(send):
+        status, data = send("POST", "/planets", {"name": bench_name()})
+        return json.loads(data)["id"]
+
+    def new_favorite(send):
+        people_id = any_id()
+        send("POST", "/users/1/favorites/people/%d" % people_id, None)
+        return people_id
+
+    return [
+        ("GET /users", "GET", lambda: "/users", None),
+        ("GET /people", "GET", lambda: "/people", None),
+        ("GET /people?after", "GET", lambda: "/people?limit=100&after=%s" % _cursor(any_id()), None),
+        ("GET /people?fields", "GET", lambda: "/people?fields=name", None),
+        ("GET /people?filter", "GET", lambda: "/people?filter[gender]=female&sort=name", None),
+        ("GET /people?prefix", "GET", lambda: "/people?filter[name]=Person%%20%d*" % random.randint(1, 99), None),
+        ("GET /people?stream", "GET", lambda: "/people?stream=1", None),
+        ("GET /people/<id>", "GET", lambda: "/people/%d" % any_id(), None),
+        ("GET /planets", "GET", lambda: "/planets", None),
+        ("GET /planets?stream", "GET", lambda: "/planets?stream=1", None),
+        ("GET /planets/<id>", "GET", lambda: "/planets/%d" % any_id(), None),
+        ("GET /starships", "GET", lambda: "/starships", None),
+        ("GET /starships/<id>", "GET", lambda: "/starships/%d" % any_id(), None),
+        ("GET /vehicles", "GET", lambda: "/vehicles", None),
+        ("GET /vehicles/<id>", "GET", lambda: "/vehicles/%d" % any_id(), None),
+        ("GET /users/favorites", "GET", lambda: "/users/favorites", None),
+        ("GET /users/<id>/favorites", "GET", lambda: "/users/1/favorites", None),
+        ("GET /search", "GET", lambda: "/search?q=%s" % random.choice(["incom", "desert", "person 4"]).replace(" ", "%20"), None),
+        ("GET /stats/people", "GET", lambda: "/stats/people", None),
+        ("GET /stats/planets?range", "GET", lambda: "/stats/planets?range[population]=%d," % (any_id() * 1000), None),
+        ("GET /changes", "GET", lambda: "/changes?since=0&limit=100", None),
+        ("POST /batch", "POST", lambda: "/batch", lambda: {"requests": [
+            {"method": "GET", "path": "/people/%d" % any_id()},
+            {"method": "GET", "path": "/planets/%d" % any_id()},
+            {"method": "GET", "path": "/people?filter[gender]=male&limit=10"},
+        ]}),
+        ("POST /planets", "POST", lambda: "/planets", lambda: {"name": bench_name()}),
+        ("POST /planets [bulk]", "POST", lambda: "/planets", lambda: [{"name": bench_name()} for _ in range(10)]),
+        ("PUT /people/<id>", "PUT", lambda: "/people/%d" % any_id(), lambda: {"mass": str(50 + random.randint(0, 39))}),
+        ("PATCH /people", "PATCH", lambda: "/people", lambda: [
+            {"id": any_id(), "height": str(150 + random.randint(0, 49))} for _ in range(10)
+        ]),
+        ("DELETE /planets/<id>", "DELETE", lambda planet_id: "/planets/%d" % planet_id, None, new_planet),
+        ("POST /users/<id>/favorites", "POST", lambda: "/users/1/favorites/people/%d" % any_id(), None),
+        ("DELETE /users/<id>/favorites", "DELETE", lambda people_id: "/users/1/favorites/people/%d" % people_id,
+         None, new_favorite),
+    ]
+
+
+def _cursor(last_id):
+    import base64
+    return base64.urlsafe_b64encode(json.dumps([last_id]).encode()).decode().rstrip("=")
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, errors, elapsed):
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def drive(send, route_list, requests, concurrency):
+    results = {}
+    for name, method, path, body, *setup in route_list:
+        latencies, errors = [], 0
+        lock = threading.Lock()
+
+        def one(_):
+            nonlocal errors
+            url = path(setup[0](send)) if setup else path()
+            payload = body() if body else None
+            started = time.perf_counter()
+            status, data = send(method, url, payload)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if status >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(requests)))
+        results[name] = summarize(latencies, errors, time.perf_counter() - started)
+        print("%-28s %8.1f req/s  p50 %7.2f ms  p95 %7.2f ms  p99 %7.2f ms  errors %d" % (
+            name, results[name]["throughput_rps"], results[name]["p50_ms"],
+            results[name]["p95_ms"], results[name]["p99_ms"], errors), file=sys.stderr)
+    return results
+
+
+def client_sender(app):
+    local = threading.local()
+
+    def send(method, path, body):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        response = local.client.open(path, method=method, json=body)
+        # Reads streamed bodies to the end
+        data = response.get_data()
+        response.close()
+        return response.status_code, data
+    return send
+
+
+def http_sender(base_url):
+    def send(method, path, body):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(base_url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+    return send
+
+
+def start_server(app, kind, port, workers):
+    if kind == 'werkzeug':
+        from werkzeug.serving import make_server, WSGIRequestHandler
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        server = make_server('127.0.0.1', port, app, threaded=True, request_handler=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server.shutdown
+    process = subprocess.Popen(
+        ['gunicorn', 'wsgi', '--chdir', SRC, '-w', str(workers), '-b', '127.0.0.1:%d' % port],
+        env=dict(os.environ), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            urllib.request.urlopen('http://127.0.0.1:%d/cache/stats' % port, timeout=1).read()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return process.terminate
+
+
+def run(args):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.database or '/tmp/bench-%d.db' % args.rows)
+    sys.path.insert(0, SRC)
+    from app import app
+    from models import db
+
+    seed(app, db, args.rows)
+    random.seed(args.seed)
+    route_list = [r for r in routes(args.rows) if not args.route or any(f in r[0] for f in args.route)]
+    results = {"meta": {
+        "rows": args.rows, "requests": args.requests, "concurrency": args.concurrency,
+        "server": args.server, "workers": args.workers, "python": platform.python_version(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }, "routes": {}}
+
+    if not args.skip_client:
+        print("== Flask test client", file=sys.stderr)
+        for name, data in drive(client_sender(app), route_list, args.requests, 1).items():
+            results["routes"][name + " [client]"] = data
+
+    print("== %s server, %d concurrent clients" % (args.server, args.concurrency), file=sys.stderr)
+    stop = start_server(app, args.server, args.port, args.workers)
+    try:
+        sender = http_sender('http://127.0.0.1:%d' % args.port)
+        for name, data in drive(sender, route_list, args.requests, args.concurrency).items():
+            results["routes"][name + " [" + args.server + "]"] = data
+    finally:
+        stop()
+
+    with open(args.output, 'w') as fp:
+        json.dump(results, fp, indent=2, sort_keys=True)
+    print("results written to %s" % args.output, file=sys.stderr)
+
+
+def compare(args):
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)["routes"]
+    with open(args.candidate) as fp:
+        candidate = json.load(fp)["routes"]
+
+    regressions = 0
+    for name in sorted(set(baseline) & set(candidate)):
+        old, new = baseline[name], candidate[name]
+        p95_change = new["p95_ms"] / old["p95_ms"] - 1 if old["p95_ms"] else 0
+        rps_change = new["throughput_rps"] / old["throughput_rps"] - 1 if old["throughput_rps"] else 0
+        regressed = p95_change > args.threshold or rps_change < -args.threshold
+        regressions += regressed
+        print("%-40s p95 %8.2f -> %8.2f ms (%+6.1f%%)  rps %8.1f -> %8.1f (%+6.1f%%)%s" % (
+            name, old["p95_ms"], new["p95_ms"], p95_change * 100,
+            old["throughput_rps"], new["throughput_rps"], rps_change * 100,
+            "  REGRESSION" if regressed else ""))
+    if regressions:
+        print("%d route(s) regressed by more than %.0f%%" % (regressions, args.threshold * 100))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='seed the database and benchmark every route')
+    run_parser.add_argument('--rows', type=int, default=10000, help='rows per table (1k to 1M)')
+    run_parser.add_argument('--requests', type=int, default=300, help='requests per route')
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='werkzeug')
+    run_parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    run_parser.add_argument('--port', type=int, default=8765)
+    run_parser.add_argument('--database', help='SQLite file, defaults to /tmp/bench-<rows>.db')
+    run_parser.add_argument('--route', action='append', help='only run routes containing this text')
+    run_parser.add_argument('--skip-client', action='store_true', help='only benchmark through the server')
+    run_parser.add_argument('--seed', type=int, default=1234)
+    run_parser.add_argument('--output', default='bench-results.json')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown, 0.10 = 10%%')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
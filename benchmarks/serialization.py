@@ -0,0 +1,73 @@
+# Compares the ORM + serialize() + jsonify path with the precompiled row serializer
+# used by the list endpoints.
+#
+#   python benchmarks/serialization.py --rows 100000 --repeat 5
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+from app import app  # noqa: E402
+from models import db, People, public_fields  # noqa: E402
+from serializers import row_serializer  # noqa: E402
+
+
+def seed(rows):
+    db.session.execute(db.insert(People), [
+        {"name": "Person %d" % i, "gender": "female" if i % 2 else "male", "birth_year": "%dBBY" % (i % 100),
+         "height": str(150 + i % 50), "mass": str(50 + i % 40), "homeworld": "Planet %d" % (i % 60)}
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+
+def orm_path():
+    people = People.query.order_by(People.id).all()
+    return app.json.dumps({"next": None, "results": [person.serialize() for person in people]})
+
+
+def row_path():
+    fields = tuple(public_fields(People))
+    serialize = row_serializer(People, fields)
+    rows = db.session.execute(db.select(*[getattr(People, f) for f in fields]).order_by(People.id))
+    return '{"next":null,"results":[%s]}' % ','.join(serialize(row) for row in rows)
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        seed(args.rows)
+        # Both paths must produce the same document
+        assert json.loads(orm_path()) == json.loads(row_path())
+
+        orm = timed(orm_path, args.repeat)
+        row = timed(row_path, args.repeat)
+    print("rows: %d" % args.rows)
+    print("orm + serialize(): %.3fs (%.0f rows/s)" % (orm, args.rows / orm))
+    print("row serializer:    %.3fs (%.0f rows/s)" % (row, args.rows / row))
+    print("speedup: %.1fx" % (orm / row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Cold start benchmark: how long a fresh worker takes to import the app and to answer
+# its first requests, for each APP_PROFILE.
+#
+#   python benchmarks/startup.py --runs 10
+#   python benchmarks/startup.py --profile api --database /tmp/bench-10000.db --output startup.json
+#
+# Every run is a new Python process, so nothing is shared between runs (no warm
+# imports, no pooled connections, no cache).
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# Runs in the child process and prints its timings as JSON
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+client = app.test_client()
+timings = {"import_ms": (imported - started) * 1000}
+for path in sys.argv[1:]:
+    before = time.perf_counter()
+    status = client.get(path).status_code
+    timings["first " + path + " ms"] = (time.perf_counter() - before) * 1000
+    if status >= 500:
+        raise SystemExit("%s returned %d" % (path, status))
+timings["ready_ms"] = (time.perf_counter() - started) * 1000
+print(json.dumps(timings))
+'''
+
+
+def measure(profile, database, paths, runs):
+    env = dict(os.environ, APP_PROFILE=profile, PYTHONDONTWRITEBYTECODE='1')
+    if database:
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(database)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', CHILD] + paths, cwd=SRC, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {name: {"median": round(statistics.median(s[name] for s in samples), 2),
+                   "min": round(min(s[name] for s in samples), 2),
+                   "max": round(max(s[name] for s in samples), 2)} for name in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', action='append', choices=('full', 'api'),
+                        help='profiles to measure, defaults to both')
+    parser.add_argument('--runs', type=int, default=10, help='fresh processes per profile')
+    parser.add_argument('--path', action='append', help='paths requested after import, in order')
+    parser.add_argument('--database', help='SQLite file to use instead of DATABASE_URL')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+
+    paths = args.path or ['/people', '/people/1']
+    results = {}
+    for profile in args.profile or ['full', 'api']:
+        results[profile] = measure(profile, args.database, paths, args.runs)
+        for name, data in results[profile].items():
+            print("%-6s %-22s median %8.2f ms  min %8.2f ms  max %8.2f ms" % (
+                profile, name, data["median"], data["min"], data["max"]))
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({"runs": args.runs, "paths": paths, "python": sys.version.split()[0],
+                       "profiles": results}, fp, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
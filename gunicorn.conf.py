@@ -0,0 +1,23 @@
+# Gunicorn settings, loaded with `gunicorn -c gunicorn.conf.py`
+import os
+import shutil
+import tempfile
+
+# prometheus_client reads this before the app is imported: each worker writes its
+# metrics to files in this directory and /metrics aggregates them
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'prometheus_multiproc'))
+
+# Workers boot with the lean API profile, /admin is built on its first request (see create_app)
+os.environ.setdefault('APP_PROFILE', 'api')
+
+
+def on_starting(server):
+    # Samples from a previous run must not leak into the new one
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,49 @@
+"""Indices y restricciones de unicidad en favorite
+
+Revision ID: 3f9a1c7d2b64
+Revises: 0c7b0f2289e1
+Create Date: 2026-10-18 10:12:40.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c7d2b64'
+down_revision = '0c7b0f2289e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Remove duplicated favorites before adding the unique constraints
+    op.execute(
+        "DELETE FROM favorite WHERE id NOT IN ("
+        "SELECT MIN(id) FROM favorite "
+        "GROUP BY user_id, people_id, planet_id, vehicle_id, starship_id)"
+    )
+
+    with op.batch_alter_table('favorite', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_favorite_user_id'), ['user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_favorite_people_id'), ['people_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_favorite_planet_id'), ['planet_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_favorite_vehicle_id'), ['vehicle_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_favorite_starship_id'), ['starship_id'], unique=False)
+        batch_op.create_unique_constraint('uq_favorite_user_people', ['user_id', 'people_id'])
+        batch_op.create_unique_constraint('uq_favorite_user_planet', ['user_id', 'planet_id'])
+        batch_op.create_unique_constraint('uq_favorite_user_vehicle', ['user_id', 'vehicle_id'])
+        batch_op.create_unique_constraint('uq_favorite_user_starship', ['user_id', 'starship_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('favorite', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_favorite_user_starship', type_='unique')
+        batch_op.drop_constraint('uq_favorite_user_vehicle', type_='unique')
+        batch_op.drop_constraint('uq_favorite_user_planet', type_='unique')
+        batch_op.drop_constraint('uq_favorite_user_people', type_='unique')
+        batch_op.drop_index(batch_op.f('ix_favorite_starship_id'))
+        batch_op.drop_index(batch_op.f('ix_favorite_vehicle_id'))
+        batch_op.drop_index(batch_op.f('ix_favorite_planet_id'))
+        batch_op.drop_index(batch_op.f('ix_favorite_people_id'))
+        batch_op.drop_index(batch_op.f('ix_favorite_user_id'))
@@ -0,0 +1,32 @@
+"""Tabla table_version para ETags
+
+Revision ID: 8d2e4a6b1c90
+Revises: 3f9a1c7d2b64
+Create Date: 2026-10-18 11:03:17.502941
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e4a6b1c90'
+down_revision = '3f9a1c7d2b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_version = op.create_table('table_version',
+        sa.Column('table_name', sa.String(length=50), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(table_version, [
+        {'table_name': name, 'version': 1}
+        for name in ('user', 'people', 'planet', 'vehicle', 'starship', 'favorite')
+    ])
+
+
+def downgrade():
+    op.drop_table('table_version')
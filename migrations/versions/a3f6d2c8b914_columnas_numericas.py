@@ -0,0 +1,71 @@
+"""Columnas numericas para rangos y /stats
+
+Revision ID: a3f6d2c8b914
+Revises: e7c3b9a1f508
+Create Date: 2026-10-18 18:05:37.402816
+
+"""
+import re
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f6d2c8b914'
+down_revision = 'e7c3b9a1f508'
+branch_labels = None
+depends_on = None
+
+NUMERIC_FIELDS = {
+    'people': ['height', 'mass'],
+    'planet': ['population', 'gravity'],
+    'vehicle': ['cost_in_credits', 'max_atmosphering_speed'],
+    'starship': ['hyperdrive_rating'],
+}
+
+BATCH_SIZE = 1000
+
+# Same parsing as models.parse_number, copied so the migration does not change with it
+NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+def parse_number(value):
+    if value is None:
+        return None
+    match = NUMBER.match(str(value).replace(',', '').strip())
+    return float(match.group()) if match else None
+
+
+def upgrade():
+    # Plain ALTER TABLE (no batch mode): recreating the tables on SQLite would drop
+    # the search triggers
+    for table, fields in NUMERIC_FIELDS.items():
+        for field in fields:
+            op.add_column(table, sa.Column(field + '_num', sa.Float(), nullable=True))
+            op.create_index('ix_%s_%s_num' % (table, field), table, [field + '_num'], unique=False)
+
+    connection = op.get_bind()
+    for table, fields in NUMERIC_FIELDS.items():
+        source = sa.table(table, sa.column('id'), *[sa.column(field) for field in fields])
+        target = sa.table(table, sa.column('id'), *[sa.column(field + '_num') for field in fields])
+        update = target.update().where(target.c.id == sa.bindparam('_id')).values(
+            {field + '_num': sa.bindparam(field + '_num') for field in fields}
+        )
+        last_id = 0
+        while True:
+            rows = connection.execute(
+                sa.select(source).where(source.c.id > last_id).order_by(source.c.id).limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            connection.execute(update, [
+                dict({field + '_num': parse_number(getattr(row, field)) for field in fields}, _id=row.id)
+                for row in rows
+            ])
+            last_id = rows[-1].id
+
+
+def downgrade():
+    for table, fields in NUMERIC_FIELDS.items():
+        for field in fields:
+            op.drop_index('ix_%s_%s_num' % (table, field), table_name=table)
+            op.drop_column(table, field + '_num')
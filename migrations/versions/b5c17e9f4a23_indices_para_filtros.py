@@ -0,0 +1,45 @@
+"""Indices para filtros y ordenamiento
+
+Revision ID: b5c17e9f4a23
+Revises: 8d2e4a6b1c90
+Create Date: 2026-10-18 12:41:05.730114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5c17e9f4a23'
+down_revision = '8d2e4a6b1c90'
+branch_labels = None
+depends_on = None
+
+INDEXED_COLUMNS = {
+    'people': ['name', 'gender', 'homeworld'],
+    'planet': ['name', 'climate', 'terrain'],
+    'starship': ['name', 'manufacturer', 'starship_class'],
+    'vehicle': ['name', 'model', 'manufacturer'],
+}
+
+
+def upgrade():
+    for table, columns in INDEXED_COLUMNS.items():
+        for column in columns:
+            op.create_index('ix_%s_%s' % (table, column), table, [column], unique=False)
+
+    # Prefix matching (LIKE 'abc%') needs pattern ops indexes on PostgreSQL
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in INDEXED_COLUMNS:
+            op.create_index('ix_%s_name_pattern' % table, table, ['name'], unique=False,
+                            postgresql_ops={'name': 'varchar_pattern_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in INDEXED_COLUMNS:
+            op.drop_index('ix_%s_name_pattern' % table, table_name=table)
+
+    for table, columns in INDEXED_COLUMNS.items():
+        for column in columns:
+            op.drop_index('ix_%s_%s' % (table, column), table_name=table)
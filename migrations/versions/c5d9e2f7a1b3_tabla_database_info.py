@@ -0,0 +1,33 @@
+"""Tabla database_info para el id de la base de datos
+
+Revision ID: c5d9e2f7a1b3
+Revises: a3f6d2c8b914
+Create Date: 2026-10-18 21:12:48.530917
+
+"""
+import uuid
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d9e2f7a1b3'
+down_revision = 'a3f6d2c8b914'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    database_info = op.create_table('database_info',
+    sa.Column('key', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.String(length=100), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.bulk_insert(database_info, [{'key': 'database_id', 'value': uuid.uuid4().hex}])
+    # The id used to be kept as a row of table_version
+    table_version = sa.table('table_version', sa.column('table_name'))
+    op.execute(table_version.delete().where(table_version.c.table_name == 'database_id'))
+
+
+def downgrade():
+    op.drop_table('database_info')
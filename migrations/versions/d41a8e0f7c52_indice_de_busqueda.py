@@ -0,0 +1,69 @@
+"""Indice de busqueda de texto completo
+
+Revision ID: d41a8e0f7c52
+Revises: b5c17e9f4a23
+Create Date: 2026-10-18 14:20:51.906377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41a8e0f7c52'
+down_revision = 'b5c17e9f4a23'
+branch_labels = None
+depends_on = None
+
+# table: (rowid slot in the SQLite index, title column, other columns)
+SEARCHABLE = {
+    'people': (0, 'name', []),
+    'planet': (1, 'name', ['terrain', 'climate']),
+    'starship': (2, 'name', ['model', 'manufacturer']),
+    'vehicle': (3, 'name', ['manufacturer']),
+}
+
+
+def _body(columns, prefix=''):
+    if not columns:
+        return "''"
+    return " || ' ' || ".join("coalesce(%s%s, '')" % (prefix, column) for column in columns)
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table, (slot, title, columns) in SEARCHABLE.items():
+            vector = "setweight(to_tsvector('simple', coalesce(%s, '')), 'A')" % title
+            if columns:
+                vector += " || setweight(to_tsvector('simple', %s), 'B')" % _body(columns)
+            op.execute('ALTER TABLE "%s" ADD COLUMN search_vector tsvector '
+                       'GENERATED ALWAYS AS (%s) STORED' % (table, vector))
+            op.execute('CREATE INDEX ix_%s_search_vector ON "%s" USING gin (search_vector)' % (table, table))
+        return
+
+    op.execute("CREATE VIRTUAL TABLE search_index USING fts5("
+               "resource UNINDEXED, entity_id UNINDEXED, title, body, "
+               "tokenize = 'unicode61 remove_diacritics 2')")
+    for table, (slot, title, columns) in SEARCHABLE.items():
+        insert = ("INSERT INTO search_index (rowid, resource, entity_id, title, body) "
+                  "VALUES (new.id * 4 + %d, '%s', new.id, new.%s, %s);" % (slot, table, title, _body(columns, 'new.')))
+        delete = "DELETE FROM search_index WHERE rowid = old.id * 4 + %d;" % slot
+        op.execute("CREATE TRIGGER %s_search_insert AFTER INSERT ON %s BEGIN %s END" % (table, table, insert))
+        op.execute("CREATE TRIGGER %s_search_update AFTER UPDATE ON %s BEGIN %s %s END" % (table, table, delete, insert))
+        op.execute("CREATE TRIGGER %s_search_delete AFTER DELETE ON %s BEGIN %s END" % (table, table, delete))
+        # Index the rows that already exist
+        op.execute("INSERT INTO search_index (rowid, resource, entity_id, title, body) "
+                   "SELECT id * 4 + %d, '%s', id, %s, %s FROM %s" % (slot, table, title, _body(columns), table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in SEARCHABLE:
+            op.execute('DROP INDEX ix_%s_search_vector' % table)
+            op.execute('ALTER TABLE "%s" DROP COLUMN search_vector' % table)
+        return
+
+    for table in SEARCHABLE:
+        for action in ('insert', 'update', 'delete'):
+            op.execute("DROP TRIGGER %s_search_%s" % (table, action))
+    op.execute("DROP TABLE search_index")
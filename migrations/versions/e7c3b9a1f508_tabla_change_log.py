@@ -0,0 +1,43 @@
+"""Tabla change_log para /changes
+
+Revision ID: e7c3b9a1f508
+Revises: d41a8e0f7c52
+Create Date: 2026-10-18 16:42:08.117305
+
+"""
+from datetime import datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c3b9a1f508'
+down_revision = 'd41a8e0f7c52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    change_log = op.create_table('change_log',
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('resource', sa.String(length=50), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=True),
+        sa.Column('op', sa.String(length=10), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('seq'),
+        sqlite_autoincrement=True
+    )
+    op.create_index('ix_change_log_created_at', 'change_log', ['created_at'], unique=False)
+
+    # Rows that exist before the feed are not in it: clients start with a resync
+    op.bulk_insert(change_log, [
+        {'resource': 'people', 'entity_id': None, 'op': 'resync',
+         'created_at': datetime.now(timezone.utc).replace(tzinfo=None)}
+    ])
+    op.execute("INSERT INTO table_version (table_name, version) VALUES ('change_log', 1)")
+
+
+def downgrade():
+    op.execute("DELETE FROM table_version WHERE table_name = 'change_log'")
+    op.drop_index('ix_change_log_created_at', table_name='change_log')
+    op.drop_table('change_log')
@@ -1,7 +1,89 @@
 import os
+from flask import g, current_app
 from flask_admin import Admin
-from models import db, User, Planet, People, Vehicle, Starship, Favorite
+from models import db, shadow_columns, User, Planet, People, Vehicle, Starship, Favorite
 from flask_admin.contrib.sqla import ModelView
+from utils import prefix_match
+from search import match_clause
+
+# Columns that lead an index (or the primary key): the only ones the admin sorts on
+def indexed_columns(model):
+    table = model.__table__
+    leading = {column.name for column in table.primary_key}
+    leading.update(index.columns[0].name for index in table.indexes)
+    leading.update(list(constraint.columns)[0].name for constraint in table.constraints
+                   if isinstance(constraint, db.UniqueConstraint))
+    return [column.name for column in table.columns if column.name in leading]
+
+def estimated_count(model):
+    if db.engine.dialect.name == 'postgresql':
+        # Planner statistics, refreshed by autovacuum / ANALYZE (-1 before the first one)
+        return db.session.scalar(db.text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+                                 {"table": '"%s"' % model.__tablename__})
+    # Read from the primary key index, an upper bound once rows have been deleted
+    return db.session.scalar(db.select(db.func.max(model.id)))
+
+# List views that stay cheap on big tables: bounded pages, sorting on indexed columns
+# only, and an estimated total instead of COUNT(*) when nothing is searched or filtered
+class AdminView(ModelView):
+    can_set_page_size = True
+    column_default_sort = ('id', False)
+
+    def __init__(self, model, session, **kwargs):
+        self.column_sortable_list = indexed_columns(model)
+        # Parsed numeric copies are maintained on write, never edited by hand
+        self.column_exclude_list = list(self.column_exclude_list or []) + shadow_columns(model)
+        self.form_excluded_columns = list(self.form_excluded_columns or []) + shadow_columns(model)
+        super().__init__(model, session, **kwargs)
+
+    # WHERE clause for the search box, None keeps Flask-Admin's LIKE search
+    def search_clause(self, search):
+        return None
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        clause = self.search_clause(search)
+        if clause is None:
+            return super()._apply_search(query, count_query, joins, count_joins, search)
+        query = query.filter(clause)
+        if count_query is not None:
+            count_query = count_query.filter(clause)
+        return query, count_query, joins, count_joins
+
+    def get_count_query(self):
+        if g.get('admin_estimated_count'):
+            return None
+        return super().get_count_query()
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        page_size = min(page_size or self.page_size, current_app.config['ADMIN_MAX_PAGE_SIZE'])
+        g.admin_estimated_count = None
+        if not search and not filters:
+            estimate = estimated_count(self.model)
+            if estimate and estimate > current_app.config['ADMIN_EXACT_COUNT_LIMIT']:
+                g.admin_estimated_count = estimate
+        count, rows = super().get_list(page, sort_column, sort_desc, search, filters, execute, page_size)
+        return g.pop('admin_estimated_count') or count, rows
+
+class UserView(AdminView):
+    column_exclude_list = ['password']
+    column_searchable_list = ['email']
+
+    def search_clause(self, search):
+        # Prefix match served by the unique index on email
+        return prefix_match(User.email, search.strip()) if search.strip() else None
+
+# People, planets, starships and vehicles are searched through the full-text index (search.py)
+class SearchIndexView(AdminView):
+    column_searchable_list = ['name']
+
+    def search_clause(self, search):
+        clause = match_clause(self.model, search)
+        return clause if clause is not None else db.false()
+
+class FavoriteView(AdminView):
+    column_list = ['id', 'user', 'people', 'planet', 'vehicle', 'starship']
+    # One query per page instead of one per row and relation
+    column_select_related_list = [Favorite.user, Favorite.people, Favorite.planet, Favorite.vehicle, Favorite.starship]
 
 def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
@@ -10,12 +92,13 @@ def setup_admin(app):
 
     
     # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(Planet, db.session))
-    admin.add_view(ModelView(People, db.session))
-    admin.add_view(ModelView(Vehicle, db.session))
-    admin.add_view(ModelView(Starship, db.session))
-    admin.add_view(ModelView(Favorite, db.session))
+    AdminView.page_size = app.config['ADMIN_PAGE_SIZE']
+    admin.add_view(UserView(User, db.session))
+    admin.add_view(SearchIndexView(Planet, db.session))
+    admin.add_view(SearchIndexView(People, db.session))
+    admin.add_view(SearchIndexView(Vehicle, db.session))
+    admin.add_view(SearchIndexView(Starship, db.session))
+    admin.add_view(FavoriteView(Favorite, db.session))
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(AdminView(YourModelName, db.session))
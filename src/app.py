@@ -1,51 +1,235 @@
 import os
-from flask import Flask, request, jsonify, url_for
-from models import db, User, People, Planet, Starship, Vehicle, Favorite
-from utils import APIException, generate_sitemap
+import tempfile
+import threading
+from flask import Flask, Blueprint, request, jsonify, url_for, current_app
+from models import db, include_object, get_versions, User, People, Planet, Starship, Vehicle, Favorite
+from utils import APIException, generate_sitemap, paginate, wants_stream, stream_collection, conditional
+from utils import parse_fields, parse_embedded_fields, collection_query, project, make_etag, not_modified
+from serializers import page_response
+from sqlalchemy.exc import IntegrityError
 from flask_cors import CORS
-from flask_migrate import Migrate
-from flask_swagger import swagger
-from admin import setup_admin
-
-app = Flask(__name__)
-app.url_map.strict_slashes = False
-
-# Database configuration
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize extensions
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
-setup_admin(app)
-
-# Handle/serialize errors like a JSON object
-@app.errorhandler(APIException)
-def handle_invalid_usage(error):
-    return jsonify(error.to_dict()), error.status_code
+from metrics import setup_metrics
+from query_inspector import setup_query_inspector
+from compression import setup_compression
+from replicas import setup_replicas, replica_urls
+import cache
+from bulk import bulk_create, bulk_update, bulk_delete, results_response
+import search
+from batch import run_batch, validate
+from changes import feed_bounds, changes_page
+import snapshots
+from expand import parse_expand, expanded_tables, with_references, row_encoder, favorite_items
+from stats import RESOURCES as STATS_RESOURCES, collection_stats
+
+# Every endpoint of the API, registered on the app by create_app()
+api = Blueprint('api', __name__)
+
+def load_config(app):
+    # Database configuration
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
+    else:
+        app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Connection pool, unset variables keep SQLAlchemy's defaults
+    pool_settings = {'pool_size': "DB_POOL_SIZE", 'max_overflow': "DB_MAX_OVERFLOW",
+                     'pool_recycle': "DB_POOL_RECYCLE", 'pool_timeout': "DB_POOL_TIMEOUT"}
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        option: int(os.environ[name]) for option, name in pool_settings.items() if name in os.environ
+    }
+    if os.getenv("DB_POOL_PRE_PING") == "1":
+        app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_pre_ping'] = True
+
+    # Optional read replicas for GET requests (see replicas.py)
+    app.config['DATABASE_REPLICA_URLS'] = replica_urls(os.getenv("DATABASE_REPLICA_URLS"))
+    app.config['REPLICA_RETRY_SECONDS'] = int(os.getenv("REPLICA_RETRY_SECONDS", 30))
+    app.config['REPLICA_STICKY_SECONDS'] = int(os.getenv("REPLICA_STICKY_SECONDS", 10))
+
+    # Pagination: default page size and the hard maximum a client can ask for
+    app.config['PAGE_SIZE'] = int(os.getenv("PAGE_SIZE", 100))
+    app.config['MAX_PAGE_SIZE'] = int(os.getenv("MAX_PAGE_SIZE", 1000))
+    # Rows fetched per round trip when streaming a whole table (?stream=1)
+    app.config['STREAM_BATCH_SIZE'] = int(os.getenv("STREAM_BATCH_SIZE", 500))
+
+    # In-process entity cache for GET /<resource>/<id> (see cache.py): entries kept
+    # and seconds before one expires
+    app.config['ENTITY_CACHE_SIZE'] = int(os.getenv("ENTITY_CACHE_SIZE", 1024))
+    app.config['ENTITY_CACHE_TTL'] = int(os.getenv("ENTITY_CACHE_TTL", 60))
+
+    # gzip/deflate responses (see compression.py): zlib level 1-9 and the smallest
+    # body worth compressing, in bytes. Streamed bodies are always compressed.
+    app.config['COMPRESS'] = os.getenv("COMPRESS", "1") == "1"
+    app.config['COMPRESS_LEVEL'] = int(os.getenv("COMPRESS_LEVEL", 6))
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv("COMPRESS_MIN_SIZE", 500))
+
+    # Opt-in slow query log and N+1 detector (see query_inspector.py)
+    app.config['SQL_INSTRUMENTATION'] = os.getenv("SQL_INSTRUMENTATION") == "1"
+    app.config['SLOW_QUERY_MS'] = int(os.getenv("SLOW_QUERY_MS", 100))
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.getenv("N_PLUS_ONE_THRESHOLD", 5))
+    app.config['N_PLUS_ONE_RAISE'] = os.getenv("N_PLUS_ONE_RAISE") == "1"
+
+    # Pre-gzipped snapshots of the unfiltered ?stream=1 exports (see snapshots.py)
+    app.config['SNAPSHOTS'] = os.getenv("SNAPSHOTS", "1") == "1"
+    app.config['SNAPSHOT_DIR'] = os.getenv("SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), 'sw-api-snapshots'))
+    app.config['SNAPSHOT_DEBOUNCE_SECONDS'] = float(os.getenv("SNAPSHOT_DEBOUNCE_SECONDS", 2))
+    app.config['SNAPSHOT_MAX_STALENESS'] = float(os.getenv("SNAPSHOT_MAX_STALENESS", 5))
+    app.config['SNAPSHOT_GZIP_LEVEL'] = int(os.getenv("SNAPSHOT_GZIP_LEVEL", 9))
+
+    # Days of history kept by `flask compact-changes` for GET /changes
+    app.config['CHANGE_LOG_RETENTION_DAYS'] = int(os.getenv("CHANGE_LOG_RETENTION_DAYS", 30))
+
+    # Most histogram buckets GET /stats/<resource> computes per field
+    app.config['STATS_MAX_BUCKETS'] = int(os.getenv("STATS_MAX_BUCKETS", 100))
+
+    # Most sub-requests a POST /batch may contain
+    app.config['BATCH_MAX_REQUESTS'] = int(os.getenv("BATCH_MAX_REQUESTS", 50))
+
+    # Admin list views (see admin.py): rows per page, the most a user can pick, and
+    # the table size above which the total is estimated instead of counted
+    app.config['ADMIN_PAGE_SIZE'] = int(os.getenv("ADMIN_PAGE_SIZE", 20))
+    app.config['ADMIN_MAX_PAGE_SIZE'] = int(os.getenv("ADMIN_MAX_PAGE_SIZE", 100))
+    app.config['ADMIN_EXACT_COUNT_LIMIT'] = int(os.getenv("ADMIN_EXACT_COUNT_LIMIT", 10000))
+
+# Serves /admin from an admin-only app that is built on the first /admin request,
+# so API workers boot without importing Flask-Admin
+class LazyAdmin:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.admin_app = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if not environ.get('PATH_INFO', '').startswith('/admin'):
+            return self.wsgi_app(environ, start_response)
+        with self._lock:
+            if self.admin_app is None:
+                self.admin_app = create_app('admin')
+        return self.admin_app(environ, start_response)
+
+# Profiles (APP_PROFILE):
+# - full: API, admin and the flask db / load-data commands (default)
+# - api: lean profile for server workers. Flask-Admin, Flask-Migrate and the loader
+#   are never imported, /admin is mounted lazily (ADMIN_LAZY=0 leaves it out)
+# - admin: only the admin, to run it as a separate process
+def create_app(profile=None):
+    profile = profile or os.getenv("APP_PROFILE", "full")
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+    load_config(app)
+
+    # Initialize extensions
+    db.init_app(app)
+    if profile in ('full', 'admin'):
+        from admin import setup_admin
+        setup_admin(app)
+        if profile == 'admin':
+            return app
+        from flask_migrate import Migrate
+        from loader import load_data_command
+        from changes import compact_changes_command
+        Migrate(app, db, include_object=include_object)
+        app.cli.add_command(load_data_command)
+        app.cli.add_command(compact_changes_command)
+    elif os.getenv("ADMIN_LAZY", "1") == "1":
+        app.wsgi_app = LazyAdmin(app.wsgi_app)
+    setup_replicas(app)
+    CORS(app)
+    setup_metrics(app)
+    setup_query_inspector(app)
+    setup_compression(app)
+
+    # Handle/serialize errors like a JSON object
+    @app.errorhandler(APIException)
+    def handle_invalid_usage(error):
+        return jsonify(error.to_dict()), error.status_code
+
+    app.register_blueprint(api)
+    return app
 
 # generate sitemap with all your endpoints
-@app.route('/')
+@api.route('/')
 def sitemap():
-    return generate_sitemap(app)
-
+    return generate_sitemap(current_app)
+
+
+@api.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(cache.get_backend().stats()), 200
+
+@api.route('/search', methods=['GET'])
+@conditional('people', 'planet', 'starship', 'vehicle')
+def search_all():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({"msg": "Query parameter q is required"}), 400
+    limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    if limit < 1:
+        raise APIException("limit must be a positive integer", status_code=400)
+    limit = min(limit, current_app.config['MAX_PAGE_SIZE'])
+    fields = parse_embedded_fields(list(search.MODELS.values()))
+    return jsonify({"results": search.search(q, limit, fields)}), 200
+
+@api.route('/changes', methods=['GET'])
+@conditional('change_log')
+def get_changes():
+    since = request.args.get('since', 0, type=int)
+    limit = max(1, min(request.args.get('limit', current_app.config['PAGE_SIZE'], type=int),
+                       current_app.config['MAX_PAGE_SIZE']))
+    horizon, latest = feed_bounds()
+    page = changes_page(since, limit) if since >= horizon else None
+    if page is None:
+        # Older changes were compacted away or a bulk load happened: fetch the
+        # collections again and continue from `latest`
+        return jsonify({"msg": "Resync required", "resync_required": True, "latest": latest}), 410
+    results, last_seq, more = page
+    next_url = url_for('api.get_changes', since=last_seq, limit=limit, _external=True) if more else None
+    return jsonify({"results": results, "since": last_seq, "latest": latest, "next": next_url}), 200
+
+@api.route('/stats/<resource>', methods=['GET'])
+def get_stats(resource):
+    model = STATS_RESOURCES.get(resource)
+    if model is None:
+        return jsonify({"msg": "No statistics for " + resource}), 404
+    # Same ETag as @conditional, for the table the resource maps to
+    tables = (model.__tablename__,)
+    etag = make_etag(tables, get_versions(*tables))
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    response = jsonify(collection_stats(model))
+    response.set_etag(etag)
+    return response, 200
+
+@api.route('/batch', methods=['POST'])
+def post_batch():
+    data = request.get_json(silent=True)
+    items = data.get('requests') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"msg": "Expected {\"requests\": [...]} with at least one request"}), 400
+    if len(items) > current_app.config['BATCH_MAX_REQUESTS']:
+        return jsonify({"msg": "A batch can't have more than %d requests" % current_app.config['BATCH_MAX_REQUESTS']}), 400
+    error = validate(items)
+    if error:
+        return jsonify({"msg": error}), 400
+    return jsonify({"responses": run_batch(items)}), 200
 
 # User endpoints
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
+@conditional('user')
 def get_users():
-    users = User.query.all()
-    return jsonify([user.serialize() for user in users]), 200
+    fields = parse_fields(User)
+    query = collection_query(User, fields)
+    rows, next_url = paginate(query, User)
+    return page_response(User, fields, rows, next_url)
 
 # People endpoints
 
-@app.route('/people', methods=['POST'])
+@api.route('/people', methods=['POST'])
 def create_people():
     data = request.get_json()
+    if isinstance(data, list):
+        return results_response(bulk_create(People, data), 201)
 
     new_people = People(
         name=data.get('name'),
@@ -59,7 +243,7 @@ def create_people():
     db.session.commit()
     return jsonify(new_people.serialize()), 201
 
-@app.route('/people/<int:planet_id>', methods=['PUT'])
+@api.route('/people/<int:people_id>', methods=['PUT'])
 def update_people(people_id):
     data = request.get_json()
     people = People.query.get(people_id)
@@ -75,9 +259,10 @@ def update_people(people_id):
     people.homeworld = data.get('homeworld', people.homeworld)
 
     db.session.commit()
+    cache.invalidate(People, people_id)
     return jsonify(people.serialize()), 200
 
-@app.route('/people/<int:people_id>', methods=['DELETE'])
+@api.route('/people/<int:people_id>', methods=['DELETE'])
 def delete_people(people_id):
     people = People.query.get(people_id)
 
@@ -86,25 +271,52 @@ def delete_people(people_id):
 
     db.session.delete(people)
     db.session.commit()
+    cache.invalidate(People, people_id)
     return jsonify({"msg": "Character deleted"}), 200
 
-@app.route('/people', methods=['GET'])
+@api.route('/people', methods=['PATCH'])
+def batch_update_people():
+    data = request.get_json()
+    if not isinstance(data, list):
+        return jsonify({"msg": "Expected a list of objects with an id"}), 400
+    return results_response(bulk_update(People, data), 200)
+
+@api.route('/people', methods=['DELETE'])
+def batch_delete_people():
+    data = request.get_json(silent=True) or {}
+    results = bulk_delete(People, data.get('ids'))
+    if results is None:
+        return jsonify({"msg": "Expected {\"ids\": [...]} with integer ids"}), 400
+    return results_response(results, 200)
+
+@api.route('/people', methods=['GET'])
+@conditional('people', expanded_tables(People))
 def get_people():
-    people = People.query.all()
-    return jsonify([person.serialize() for person in people]), 200
-
-@app.route('/people/<int:people_id>', methods=['GET'])
+    names = parse_expand(People)
+    fields = with_references(People, parse_fields(People), names)
+    encode = row_encoder(People, fields, names) if names else None
+    query = collection_query(People, fields)
+    if wants_stream():
+        return snapshots.serve(People) or stream_collection(query, People, fields, encode)
+    rows, next_url = paginate(query, People)
+    return page_response(People, fields, rows, next_url, encode)
+
+@api.route('/people/<int:people_id>', methods=['GET'])
+@conditional('people')
 def get_one_person(people_id):
-    person = People.query.filter_by(id=people_id).first()
+    fields = parse_fields(People)
+    person = cache.get_entity(People, people_id)
     if not person:
         return jsonify({"msg": "Character not found"}), 404
-    return jsonify(person.serialize()), 200
+    return jsonify(project(person, fields)), 200
 
 # Planet endpoints
 
-@app.route('/planets', methods=['POST'])
+@api.route('/planets', methods=['POST'])
 def create_planet():
     data = request.get_json()
+    if isinstance(data, list):
+        return results_response(bulk_create(Planet, data), 201)
 
     new_planet = Planet(
         name=data.get('name'),
@@ -117,7 +329,7 @@ def create_planet():
     db.session.commit()
     return jsonify(new_planet.serialize()), 201
 
-@app.route('/planets/<int:planet_id>', methods=['PUT'])
+@api.route('/planets/<int:planet_id>', methods=['PUT'])
 def update_planet(planet_id):
     data = request.get_json()
     planet = Planet.query.get(planet_id)
@@ -132,9 +344,10 @@ def update_planet(planet_id):
     planet.gravity = data.get('gravity', planet.gravity)
 
     db.session.commit()
+    cache.invalidate(Planet, planet_id)
     return jsonify(planet.serialize()), 200
 
-@app.route('/planets/<int:planet_id>', methods=['DELETE'])
+@api.route('/planets/<int:planet_id>', methods=['DELETE'])
 def delete_planet(planet_id):
     planet = Planet.query.get(planet_id)
 
@@ -143,25 +356,50 @@ def delete_planet(planet_id):
 
     db.session.delete(planet)
     db.session.commit()
+    cache.invalidate(Planet, planet_id)
     return jsonify({"msg": "Planet deleted"}), 200
 
-@app.route('/planets', methods=['GET'])
+@api.route('/planets', methods=['PATCH'])
+def batch_update_planets():
+    data = request.get_json()
+    if not isinstance(data, list):
+        return jsonify({"msg": "Expected a list of objects with an id"}), 400
+    return results_response(bulk_update(Planet, data), 200)
+
+@api.route('/planets', methods=['DELETE'])
+def batch_delete_planets():
+    data = request.get_json(silent=True) or {}
+    results = bulk_delete(Planet, data.get('ids'))
+    if results is None:
+        return jsonify({"msg": "Expected {\"ids\": [...]} with integer ids"}), 400
+    return results_response(results, 200)
+
+@api.route('/planets', methods=['GET'])
+@conditional('planet')
 def get_planets():
-    planets = Planet.query.all()
-    return jsonify([planet.serialize() for planet in planets]), 200
-
-@app.route('/planets/<int:planet_id>', methods=['GET'])
+    fields = parse_fields(Planet)
+    query = collection_query(Planet, fields)
+    if wants_stream():
+        return snapshots.serve(Planet) or stream_collection(query, Planet, fields)
+    rows, next_url = paginate(query, Planet)
+    return page_response(Planet, fields, rows, next_url)
+
+@api.route('/planets/<int:planet_id>', methods=['GET'])
+@conditional('planet')
 def get_one_planet(planet_id):
-    planet = Planet.query.filter_by(id=planet_id).first()
+    fields = parse_fields(Planet)
+    planet = cache.get_entity(Planet, planet_id)
     if not planet:
         return jsonify({"msg": "Planet not found"}), 404
-    return jsonify(planet.serialize()), 200
+    return jsonify(project(planet, fields)), 200
 
 # Starship endpoints
 
-@app.route('/starships', methods=['POST'])
+@api.route('/starships', methods=['POST'])
 def create_starships():
     data = request.get_json()
+    if isinstance(data, list):
+        return results_response(bulk_create(Starship, data), 201)
 
     new_starship = Starship(
         name=data.get('name'),
@@ -174,7 +412,7 @@ def create_starships():
     db.session.commit()
     return jsonify(new_starship.serialize()), 201
 
-@app.route('/starships/<int:starship_id>', methods=['PUT'])
+@api.route('/starships/<int:starship_id>', methods=['PUT'])
 def update_starship(starship_id):
     data = request.get_json()
     starship = Starship.query.get(starship_id)
@@ -189,9 +427,10 @@ def update_starship(starship_id):
     starship.hyperdrive_rating = data.get('hyperdrive_rating', starship.hyperdrive_rating)
 
     db.session.commit()
+    cache.invalidate(Starship, starship_id)
     return jsonify(starship.serialize()), 200
 
-@app.route('/starships/<int:starship_id>', methods=['DELETE'])
+@api.route('/starships/<int:starship_id>', methods=['DELETE'])
 def delete_starship(starship_id):
     starship = Starship.query.get(starship_id)
 
@@ -200,19 +439,42 @@ def delete_starship(starship_id):
 
     db.session.delete(starship)
     db.session.commit()
+    cache.invalidate(Starship, starship_id)
     return jsonify({"msg": "Starship deleted"}), 200
 
-@app.route('/starships', methods=['GET'])
+@api.route('/starships', methods=['PATCH'])
+def batch_update_starships():
+    data = request.get_json()
+    if not isinstance(data, list):
+        return jsonify({"msg": "Expected a list of objects with an id"}), 400
+    return results_response(bulk_update(Starship, data), 200)
+
+@api.route('/starships', methods=['DELETE'])
+def batch_delete_starships():
+    data = request.get_json(silent=True) or {}
+    results = bulk_delete(Starship, data.get('ids'))
+    if results is None:
+        return jsonify({"msg": "Expected {\"ids\": [...]} with integer ids"}), 400
+    return results_response(results, 200)
+
+@api.route('/starships', methods=['GET'])
+@conditional('starship')
 def get_starships():
-    starships = Starship.query.all()
-    return jsonify([starship.serialize() for starship in starships]), 200
-
-@app.route('/starships/<int:starship_id>', methods=['GET'])
+    fields = parse_fields(Starship)
+    query = collection_query(Starship, fields)
+    if wants_stream():
+        return snapshots.serve(Starship) or stream_collection(query, Starship, fields)
+    rows, next_url = paginate(query, Starship)
+    return page_response(Starship, fields, rows, next_url)
+
+@api.route('/starships/<int:starship_id>', methods=['GET'])
+@conditional('starship')
 def get_one_starship(starship_id):
-    starship = Starship.query.filter_by(id=starship_id).first()
+    fields = parse_fields(Starship)
+    starship = cache.get_entity(Starship, starship_id)
     if not starship:
         return jsonify({"msg": "Starship not found"}), 404
-    return jsonify(starship.serialize()), 200
+    return jsonify(project(starship, fields)), 200
 
 # Vehicle endpoints
 
@@ -222,9 +484,11 @@ def get_one_starship(starship_id):
 #cost_in_credits = db.Column(db.String(120))
 #max_atmosphering_speed = db.Column(db.String(120))
 
-@app.route('/vehicles', methods=['POST'])
+@api.route('/vehicles', methods=['POST'])
 def create_vehicle():
     data = request.get_json()
+    if isinstance(data, list):
+        return results_response(bulk_create(Vehicle, data), 201)
 
     new_vehicle = Vehicle(
         name=data.get('name'),
@@ -237,7 +501,7 @@ def create_vehicle():
     db.session.commit()
     return jsonify(new_vehicle.serialize()), 201
 
-@app.route('/vehicles/<int:vehicle_id>', methods=['PUT'])
+@api.route('/vehicles/<int:vehicle_id>', methods=['PUT'])
 def update_vehicle(vehicle_id):
     data = request.get_json()
     vehicle = Vehicle.query.get(vehicle_id)
@@ -252,9 +516,10 @@ def update_vehicle(vehicle_id):
     vehicle.max_atmosphering_speed = data.get('max_atmosphering_speed', vehicle.max_atmosphering_speed)
 
     db.session.commit()
+    cache.invalidate(Vehicle, vehicle_id)
     return jsonify(vehicle.serialize()), 200
 
-@app.route('/vehicles/<int:vehicle_id>', methods=['DELETE'])
+@api.route('/vehicles/<int:vehicle_id>', methods=['DELETE'])
 def delete_vehicle(vehicle_id):
     vehicle = Vehicle.query.get(vehicle_id)
 
@@ -263,27 +528,114 @@ def delete_vehicle(vehicle_id):
 
     db.session.delete(vehicle)
     db.session.commit()
+    cache.invalidate(Vehicle, vehicle_id)
     return jsonify({"msg": "Vehicle deleted"}), 200
 
-@app.route('/vehicles', methods=['GET'])
+@api.route('/vehicles', methods=['PATCH'])
+def batch_update_vehicles():
+    data = request.get_json()
+    if not isinstance(data, list):
+        return jsonify({"msg": "Expected a list of objects with an id"}), 400
+    return results_response(bulk_update(Vehicle, data), 200)
+
+@api.route('/vehicles', methods=['DELETE'])
+def batch_delete_vehicles():
+    data = request.get_json(silent=True) or {}
+    results = bulk_delete(Vehicle, data.get('ids'))
+    if results is None:
+        return jsonify({"msg": "Expected {\"ids\": [...]} with integer ids"}), 400
+    return results_response(results, 200)
+
+@api.route('/vehicles', methods=['GET'])
+@conditional('vehicle')
 def get_vehicles():
-    vehicles = Vehicle.query.all()
-    return jsonify([vehicle.serialize() for vehicle in vehicles]), 200
-
-@app.route('/vehicles/<int:vehicle_id>', methods=['GET'])
+    fields = parse_fields(Vehicle)
+    query = collection_query(Vehicle, fields)
+    if wants_stream():
+        return snapshots.serve(Vehicle) or stream_collection(query, Vehicle, fields)
+    rows, next_url = paginate(query, Vehicle)
+    return page_response(Vehicle, fields, rows, next_url)
+
+@api.route('/vehicles/<int:vehicle_id>', methods=['GET'])
+@conditional('vehicle')
 def get_one_vehicle(vehicle_id):
-    vehicle = Vehicle.query.filter_by(id=vehicle_id).first()
+    fields = parse_fields(Vehicle)
+    vehicle = cache.get_entity(Vehicle, vehicle_id)
     if not vehicle:
         return jsonify({"msg": "Vehicle not found"}), 404
-    return jsonify(vehicle.serialize()), 200
+    return jsonify(project(vehicle, fields)), 200
 
 # Favorites endpoints
-@app.route('/users/favorites', methods=['GET'])
+FAVORITE_MODELS = {
+    'people': People,
+    'planet': Planet,
+    'vehicle': Vehicle,
+    'starship': Starship,
+}
+
+# Idempotent insert: returns the existing favorite if the user already has it
+def upsert_favorite(user_id, kind, entity_id):
+    column = kind + '_id'
+    favorite = Favorite.query.filter_by(user_id=user_id, **{column: entity_id}).first()
+    if favorite:
+        return favorite, False
+
+    favorite = Favorite(user_id=user_id, **{column: entity_id})
+    db.session.add(favorite)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request inserted the same favorite first
+        db.session.rollback()
+        favorite = Favorite.query.filter_by(user_id=user_id, **{column: entity_id}).first()
+        if not favorite:
+            raise
+        return favorite, False
+    return favorite, True
+
+@api.route('/users/favorites', methods=['GET'])
+@conditional('favorite', 'people', 'planet', 'vehicle', 'starship')
 def get_favorites():
-    favorites = Favorite.query.all()
-    return jsonify([favorite.serialize() for favorite in favorites]), 200
+    favorites = db.session.execute(db.select(*Favorite.__table__.columns).order_by(Favorite.id)).all()
+    return jsonify(favorite_items(favorites, parse_expand(Favorite, FAVORITE_MODELS),
+                                  parse_embedded_fields(list(FAVORITE_MODELS.values())))), 200
+
+@api.route('/users/<int:user_id>/favorites', methods=['GET'])
+@conditional('user', 'favorite', 'people', 'planet', 'vehicle', 'starship')
+def get_user_favorites(user_id):
+    if not db.session.get(User, user_id):
+        return jsonify({"msg": "User not found"}), 404
+    favorites = db.session.execute(
+        db.select(*Favorite.__table__.columns).where(Favorite.user_id == user_id).order_by(Favorite.id)
+    ).all()
+    return jsonify(favorite_items(favorites, parse_expand(Favorite, FAVORITE_MODELS),
+                                  parse_embedded_fields(list(FAVORITE_MODELS.values())))), 200
+
+@api.route('/users/<int:user_id>/favorites/<kind>/<int:entity_id>', methods=['POST'])
+def add_user_favorite(user_id, kind, entity_id):
+    model = FAVORITE_MODELS.get(kind)
+    if model is None:
+        return jsonify({"msg": "Unknown favorite type"}), 404
+    if not db.session.get(User, user_id):
+        return jsonify({"msg": "User not found"}), 404
+    if not db.session.get(model, entity_id):
+        return jsonify({"msg": "Favorite " + kind + " not found"}), 404
+
+    favorite, created = upsert_favorite(user_id, kind, entity_id)
+    return jsonify(favorite.serialize()), 201 if created else 200
+
+@api.route('/users/<int:user_id>/favorites/<kind>/<int:entity_id>', methods=['DELETE'])
+def delete_user_favorite(user_id, kind, entity_id):
+    if kind not in FAVORITE_MODELS:
+        return jsonify({"msg": "Unknown favorite type"}), 404
+    favorite = Favorite.query.filter_by(user_id=user_id, **{kind + '_id': entity_id}).first()
+    if not favorite:
+        return jsonify({"msg": "Favorite " + kind + " not found"}), 404
+    db.session.delete(favorite)
+    db.session.commit()
+    return jsonify({"msg": "Favorite " + kind + " deleted"}), 200
 
-@app.route('/favorite/planet/<int:planet_id>', methods=['POST'])
+@api.route('/favorite/planet/<int:planet_id>', methods=['POST'])
 def add_fav_planet(planet_id):
     data = request.get_json()  # Obtener datos del cuerpo
     user_id = data.get('user_id') if data else None
@@ -291,35 +643,27 @@ def add_fav_planet(planet_id):
     if not user_id:
         return jsonify({"msg": "User ID is required"}), 400
 
-    favorite = Favorite(user_id=user_id, planet_id=planet_id)
-    db.session.add(favorite)
-    db.session.commit()
+    upsert_favorite(user_id, 'planet', planet_id)
     return jsonify({"msg": "Favorite planet added"}), 200
 
 
-@app.route('/favorite/people/<int:people_id>', methods=['POST'])
+@api.route('/favorite/people/<int:people_id>', methods=['POST'])
 def add_fav_person(people_id):
-    favorite = Favorite(people_id=people_id)
-    db.session.add(favorite)
-    db.session.commit()
+    upsert_favorite(None, 'people', people_id)
     return jsonify({"msg": "Favorite character added"}), 200
 
-@app.route('/favorite/starship/<int:starship_id>', methods=['POST'])
+@api.route('/favorite/starship/<int:starship_id>', methods=['POST'])
 def add_fav_starship(starship_id):
-    favorite = Favorite(starship_id=starship_id)
-    db.session.add(favorite)
-    db.session.commit()
+    upsert_favorite(None, 'starship', starship_id)
     return jsonify({"msg": "Favorite starship added"}), 200
 
-@app.route('/favorite/vehicle/<int:vehicle_id>', methods=['POST'])
+@api.route('/favorite/vehicle/<int:vehicle_id>', methods=['POST'])
 def add_fav_vehicle(vehicle_id):
-    favorite = Favorite(vehicle_id=vehicle_id)
-    db.session.add(favorite)
-    db.session.commit()
+    upsert_favorite(None, 'vehicle', vehicle_id)
     return jsonify({"msg": "Favorite vehicle added"}), 200
 
 # Delete favorites
-@app.route('/favorite/planet/<int:planet_id>', methods=['DELETE'])
+@api.route('/favorite/planet/<int:planet_id>', methods=['DELETE'])
 def delete_fav_planet(planet_id):
     favorite = Favorite.query.filter_by(planet_id=planet_id).first()
     if not favorite:
@@ -328,7 +672,7 @@ def delete_fav_planet(planet_id):
     db.session.commit()
     return jsonify({"msg": "Favorite planet deleted"}), 200
 
-@app.route('/favorite/people/<int:people_id>', methods=['DELETE'])
+@api.route('/favorite/people/<int:people_id>', methods=['DELETE'])
 def delete_fav_person(people_id):
     favorite = Favorite.query.filter_by(people_id=people_id).first()
     if not favorite:
@@ -337,6 +681,8 @@ def delete_fav_person(people_id):
     db.session.commit()
     return jsonify({"msg": "Favorite character deleted"}), 200
 
+app = create_app()
+
 # This only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
@@ -0,0 +1,156 @@
+# ASGI entry point: uvicorn asgi:application --app-dir src
+#
+# The hot read endpoints (GET collections and GET by id) run here as coroutines on
+# SQLAlchemy's async engine (aiosqlite / asyncpg), so one worker serves many
+# concurrent requests while they wait on the database. Every other route, NDJSON
+# streaming and ?expand= are handed to the Flask app through WsgiToAsgi.
+#
+# Async requests run inside a Flask request context, so the helpers in utils.py,
+# the after_request hooks (CORS, metrics) and the error handlers are the same ones
+# the WSGI app uses and the responses are byte for byte the same. Keep the views
+# below in line with the matching views in app.py.
+
+import io
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import request, jsonify
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from app import app
+from models import TableVersion, User, People, Planet, Starship, Vehicle
+from utils import (collection_query, page_select, finish_page, parse_fields, project, wants_stream,
+                   make_etag, not_modified)
+from serializers import page_response
+from replicas import ReplicaSet, read_from_replica, request_replica
+import cache
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+def async_url(url):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+engine_options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+engine = create_async_engine(async_url(app.config['SQLALCHEMY_DATABASE_URI']), **engine_options)
+replicas = None
+if app.config['DATABASE_REPLICA_URLS']:
+    replicas = ReplicaSet(
+        [create_async_engine(async_url(url), **engine_options) for url in app.config['DATABASE_REPLICA_URLS']],
+        retry_after=app.config['REPLICA_RETRY_SECONDS'],
+    )
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+async def get_versions(session, tables):
+    rows = await session.execute(
+        TableVersion.__table__.select().where(TableVersion.table_name.in_(tables))
+    )
+    versions = {row.table_name: row.version for row in rows}
+    return [versions.get(name, 0) for name in tables]
+
+async def get_collection(session, model):
+    tables = (model.__tablename__,)
+    etag = make_etag(tables, await get_versions(session, tables))
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    fields = parse_fields(model)
+    stmt, keys, limit = page_select(collection_query(model, fields), model)
+    rows, next_url = finish_page((await session.execute(stmt)).all(), keys, limit)
+    response = page_response(model, fields, rows, next_url)
+    response.set_etag(etag)
+    return response
+
+async def get_one(session, model, entity_id, label):
+    tables = (model.__tablename__,)
+    versions = await get_versions(session, tables)
+    etag = make_etag(tables, versions)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    fields = parse_fields(model)
+    data = cache.lookup(model, entity_id, versions[0])
+    if data is None:
+        entity = await session.get(model, entity_id)
+        if entity is None:
+            return jsonify({"msg": label + " not found"}), 404
+        data = entity.serialize()
+        cache.store(model, entity_id, versions[0], data)
+
+    response = app.make_response(jsonify(project(data, fields)))
+    response.set_etag(etag)
+    return response
+
+# Flask endpoint name -> async implementation
+ASYNC_VIEWS = {
+    'api.get_users': lambda session: get_collection(session, User),
+    'api.get_people': lambda session: get_collection(session, People),
+    'api.get_planets': lambda session: get_collection(session, Planet),
+    'api.get_starships': lambda session: get_collection(session, Starship),
+    'api.get_vehicles': lambda session: get_collection(session, Vehicle),
+    'api.get_one_person': lambda session, people_id: get_one(session, People, people_id, "Character"),
+    'api.get_one_planet': lambda session, planet_id: get_one(session, Planet, planet_id, "Planet"),
+    'api.get_one_starship': lambda session, starship_id: get_one(session, Starship, starship_id, "Starship"),
+    'api.get_one_vehicle': lambda session, vehicle_id: get_one(session, Vehicle, vehicle_id, "Vehicle"),
+}
+
+wsgi_fallback = WsgiToAsgi(app)
+
+def build_environ(scope):
+    # Same environ the WsgiToAsgi adapter builds, GET requests have no body to read
+    adapter = WsgiToAsgiInstance(app)
+    adapter.scope = scope
+    return adapter.build_environ(scope, io.BytesIO())
+
+async def dispatch():
+    # Same steps as Flask.full_dispatch_request, with an awaited view
+    try:
+        rv = app.preprocess_request()
+        if rv is None:
+            bind = engine
+            if replicas and read_from_replica():
+                bind = request_replica(replicas) or engine
+            async with Session(bind=bind) as session:
+                rv = await ASYNC_VIEWS[request.endpoint](session, **request.view_args)
+    except Exception as error:
+        rv = app.handle_user_exception(error)
+    return app.finalize_request(rv)
+
+async def send_response(response, send, head=False):
+    body = b'' if head else response.get_data()
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                    for name, value in response.headers.items()],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            for replica in (replicas.engines if replicas else ()):
+                await replica.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+        ctx = app.request_context(build_environ(scope))
+        ctx.push()
+        try:
+            if request.endpoint in ASYNC_VIEWS and not wants_stream() and 'expand' not in request.args:
+                try:
+                    response = await dispatch()
+                except Exception as error:
+                    response = app.handle_exception(error)
+                return await send_response(response, send, head=scope['method'] == 'HEAD')
+        finally:
+            ctx.pop()
+
+    return await wsgi_fallback(scope, receive, send)
@@ -0,0 +1,89 @@
+from flask import current_app, request, json
+from flask.globals import app_ctx
+from werkzeug.test import EnvironBuilder
+from models import db
+from replicas import STICKY_COOKIE
+
+# POST /batch: runs sub-requests against the existing routes, in order, inside the
+# app context (and so the database session) of the batch request. Every sub-request
+# goes through the normal dispatch (hooks, error handlers, @conditional) with a
+# fresh `g`. Writes commit as their route does, so a batch is not atomic.
+#
+#   {"requests": [{"method": "GET", "path": "/planets/1"},
+#                 {"method": "POST", "path": "/people", "body": {...}, "headers": {...}}]}
+
+def _environ(item, cookies):
+    # The batch response as a whole is compressed, its parts must stay plain text
+    headers = {name: value for name, value in (item.get('headers') or {}).items()
+               if name.lower() != 'accept-encoding'}
+    if cookies:
+        headers['Cookie'] = '; '.join('%s=%s' % pair for pair in cookies.items())
+    return EnvironBuilder(
+        path=item['path'],
+        base_url=request.host_url,
+        method=item.get('method', 'GET').upper(),
+        headers=headers,
+        json=item.get('body'),
+        environ_base={'REMOTE_ADDR': request.remote_addr},
+    ).get_environ()
+
+def _dispatch(app, environ):
+    ctx = app_ctx._get_current_object()
+    outer_g = ctx.g
+    ctx.g = app.app_ctx_globals_class()
+    try:
+        with app.request_context(environ):
+            try:
+                response = app.full_dispatch_request()
+            except Exception as error:
+                db.session.rollback()
+                response = app.handle_exception(error)
+            # Read (and consume a streamed body) while the sub-request is active
+            return response, response.get_data()
+    finally:
+        ctx.g = outer_g
+
+def _result(response, data):
+    headers = {name: value for name, value in response.headers.items() if name != 'Content-Length'}
+    if response.is_json and data:
+        body = json.loads(data)
+    else:
+        body = data.decode('utf-8') if data else None
+    return {"status": response.status_code, "headers": headers, "body": body}
+
+def validate(items):
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str) or not item['path'].startswith('/'):
+            return "Request %d needs a path starting with /" % index
+        if item['path'].split('?')[0].rstrip('/') == '/batch':
+            return "Request %d: batches can't be nested" % index
+        if not isinstance(item.get('method', 'GET'), str):
+            return "Request %d: method must be a string" % index
+        headers = item.get('headers') or {}
+        if not isinstance(headers, dict) or not all(isinstance(value, str) for value in headers.values()):
+            return "Request %d: headers must be an object of strings" % index
+    return None
+
+def run_batch(items):
+    app = current_app._get_current_object()
+    cookies = dict(request.cookies)
+    results = []
+    # Identical GETs are answered once until a write runs
+    seen = {}
+    for item in items:
+        method = item.get('method', 'GET').upper()
+        key = (item['path'], json.dumps(item.get('headers') or {}, sort_keys=True))
+        if method == 'GET' and key in seen:
+            results.append(seen[key])
+            continue
+
+        result = _result(*_dispatch(app, _environ(item, cookies)))
+        results.append(result)
+        if method == 'GET':
+            seen[key] = result
+        elif method not in ('HEAD', 'OPTIONS'):
+            seen.clear()
+            if result["status"] < 400:
+                # Later reads of this batch must see the write (replicas.py)
+                cookies[STICKY_COOKIE] = '1'
+    return results
@@ -0,0 +1,125 @@
+from flask import jsonify
+from models import db, bump_version, log_changes, mark_changed, shadow_columns, fill_numeric
+import cache
+
+def writable_fields(model):
+    shadows = shadow_columns(model)
+    return [column.name for column in model.__table__.columns
+            if not column.primary_key and column.name not in shadows]
+
+def required_fields(model):
+    return [column.name for column in model.__table__.columns
+            if not column.primary_key and not column.nullable]
+
+def _clean(model, item):
+    fields = writable_fields(model)
+    return {key: value for key, value in item.items() if key in fields}
+
+# Columns hold strings and numbers: anything else would fail in the driver
+def _not_scalar(model, item):
+    return [key for key, value in _clean(model, item).items()
+            if isinstance(value, bool) or not isinstance(value, (str, int, float, type(None)))]
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def results_response(results, ok_status):
+    status = ok_status if all(r["status"] < 400 for r in results) else 207
+    return jsonify({"results": results}), status
+
+# Batch writes. Each one runs as a single statement (executemany) inside one transaction
+# and returns one result per input item so partial failures are visible to the client.
+
+def bulk_create(model, items):
+    results = [None] * len(items)
+    rows, positions = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = {"index": index, "status": 400, "msg": "Item must be an object"}
+            continue
+        missing = [field for field in required_fields(model) if not item.get(field)]
+        if missing:
+            results[index] = {"index": index, "status": 400, "msg": "Missing fields: " + ", ".join(missing)}
+            continue
+        invalid = _not_scalar(model, item)
+        if invalid:
+            results[index] = {"index": index, "status": 400, "msg": "Invalid values: " + ", ".join(invalid)}
+            continue
+        row = dict.fromkeys(writable_fields(model))
+        row.update(_clean(model, item))
+        rows.append(fill_numeric(model, row))
+        positions.append(index)
+
+    if rows:
+        stmt = db.insert(model).returning(model.id, sort_by_parameter_order=True)
+        ids = db.session.scalars(stmt, rows).all()
+        bump_version(db.session.connection(), model.__tablename__)
+        mark_changed(db.session, model.__tablename__)
+        log_changes(db.session.connection(), model.__tablename__, 'upsert', ids)
+        db.session.commit()
+        for index, new_id in zip(positions, ids):
+            results[index] = {"index": index, "status": 201, "id": new_id}
+    return results
+
+def bulk_update(model, items):
+    results = [None] * len(items)
+    wanted = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not _is_id(item.get('id')):
+            results[index] = {"index": index, "status": 400, "msg": "Item must be an object with an integer id"}
+            continue
+        wanted[index] = item
+
+    ids = {item['id'] for item in wanted.values()}
+    existing = set(db.session.scalars(db.select(model.id).where(model.id.in_(ids)))) if ids else set()
+
+    rows = []
+    for index, item in wanted.items():
+        if item['id'] not in existing:
+            results[index] = {"index": index, "status": 404, "id": item['id'], "msg": "Not found"}
+            continue
+        row = _clean(model, item)
+        if not row:
+            results[index] = {"index": index, "status": 200, "id": item['id']}
+            continue
+        empty = [field for field in required_fields(model) if field in row and not row[field]]
+        if empty:
+            results[index] = {"index": index, "status": 400, "id": item['id'], "msg": "Empty fields: " + ", ".join(empty)}
+            continue
+        invalid = _not_scalar(model, item)
+        if invalid:
+            results[index] = {"index": index, "status": 400, "id": item['id'], "msg": "Invalid values: " + ", ".join(invalid)}
+            continue
+        row['id'] = item['id']
+        rows.append(fill_numeric(model, row))
+        results[index] = {"index": index, "status": 200, "id": item['id']}
+
+    if rows:
+        # ORM bulk UPDATE by primary key; rows are grouped by key set into executemany batches
+        db.session.execute(db.update(model), rows)
+        bump_version(db.session.connection(), model.__tablename__)
+        mark_changed(db.session, model.__tablename__)
+        log_changes(db.session.connection(), model.__tablename__, 'upsert', [row['id'] for row in rows])
+        db.session.commit()
+        for row in rows:
+            cache.invalidate(model, row['id'])
+    return results
+
+def bulk_delete(model, ids):
+    if not isinstance(ids, list) or not all(_is_id(i) for i in ids):
+        return None
+    existing = set(db.session.scalars(db.select(model.id).where(model.id.in_(ids)))) if ids else set()
+    if existing:
+        db.session.execute(
+            db.delete(model).where(model.id.in_(existing)).execution_options(synchronize_session=False)
+        )
+        bump_version(db.session.connection(), model.__tablename__)
+        mark_changed(db.session, model.__tablename__)
+        log_changes(db.session.connection(), model.__tablename__, 'delete', sorted(existing))
+        db.session.commit()
+        for entity_id in existing:
+            cache.invalidate(model, entity_id)
+    return [
+        {"index": index, "id": entity_id, "status": 200 if entity_id in existing else 404}
+        for index, entity_id in enumerate(ids)
+    ]
@@ -0,0 +1,133 @@
+import time
+import threading
+from collections import OrderedDict
+from flask import g, current_app
+from models import db, get_versions
+
+# Interface for the entity cache. Implement it to plug a shared cache (Redis, memcached...)
+# and pass an instance to set_backend().
+class CacheBackend:
+    # `is_current(value)` false means the entry is outdated: return None, count a miss
+    def get(self, key, is_current=None):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+# Bounded in-process cache: least recently used entries are evicted first
+# and every entry expires after `ttl` seconds
+class LRUCache(CacheBackend):
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.outdated = 0
+
+    def get(self, key, is_current=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if is_current is not None and not is_current(value):
+                # Kept: a request on a lagging replica may ask for an older version
+                self.outdated += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "lru",
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "outdated": self.outdated,
+            }
+
+# One cache per process, sized from the config of the app that first uses it
+# (ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL) unless set_backend() was called before
+backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    global backend
+    if backend is None:
+        with _backend_lock:
+            if backend is None:
+                backend = LRUCache(max_size=current_app.config['ENTITY_CACHE_SIZE'],
+                                   ttl=current_app.config['ENTITY_CACHE_TTL'])
+    return backend
+
+def set_backend(new_backend):
+    global backend
+    with _backend_lock:
+        backend = new_backend
+
+def _table_version(table):
+    # Reuse the versions already read by @conditional for this request
+    versions = getattr(g, 'table_versions', None)
+    if versions and table in versions:
+        return versions[table]
+    return get_versions(table)[0]
+
+def lookup(model, entity_id, version):
+    cached = get_backend().get((model.__tablename__, entity_id), lambda cached: cached[0] == version)
+    return cached[1] if cached is not None else None
+
+def store(model, entity_id, version, data):
+    get_backend().set((model.__tablename__, entity_id), (version, data))
+
+# Read-through lookup of a serialized entity. Entries are stored with the table
+# version they were read at, so a write made by another worker is never served.
+def get_entity(model, entity_id):
+    version = _table_version(model.__tablename__)
+    data = lookup(model, entity_id, version)
+    if data is not None:
+        return data
+
+    entity = db.session.get(model, entity_id)
+    if entity is None:
+        return None
+    data = entity.serialize()
+    store(model, entity_id, version, data)
+    return data
+
+def invalidate(model, entity_id):
+    get_backend().delete((model.__tablename__, entity_id))
@@ -0,0 +1,75 @@
+from datetime import timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, Change, bump_version, utcnow, People, Planet, Starship, Vehicle
+
+# GET /changes?since=<seq> returns the changes after a client's last seq, oldest first.
+# Entries older than CHANGE_LOG_RETENTION_DAYS are removed by `flask compact-changes`;
+# a client whose seq falls before what is left (or before a bulk load) must resync.
+
+MODELS = {model.__tablename__: model for model in (People, Planet, Starship, Vehicle)}
+
+# (horizon, latest): seqs up to the horizon are gone or were invalidated by a
+# resync marker, latest is the newest seq in the feed
+def feed_bounds():
+    first, latest, resync = db.session.execute(db.select(
+        db.func.min(Change.seq),
+        db.func.max(Change.seq),
+        db.func.max(db.case((Change.op == 'resync', Change.seq))),
+    )).one()
+    horizon = max(first - 1 if first else 0, resync or 0)
+    return horizon, latest or 0
+
+def changes_page(since, limit):
+    rows = db.session.execute(
+        db.select(Change.seq, Change.resource, Change.entity_id, Change.op)
+        .where(Change.seq > since).order_by(Change.seq).limit(limit + 1)
+    ).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if any(row.op == 'resync' for row in rows):
+        return None
+
+    # Only the last change of each entity in the page matters
+    last = {}
+    for row in rows:
+        last.pop((row.resource, row.entity_id), None)
+        last[(row.resource, row.entity_id)] = row
+
+    data = {}
+    for resource, model in MODELS.items():
+        ids = [row.entity_id for row in last.values() if row.resource == resource and row.op == 'upsert']
+        if ids:
+            for entity in model.query.filter(model.id.in_(ids)):
+                data[(resource, entity.id)] = entity.serialize()
+
+    results = []
+    for (resource, entity_id), row in last.items():
+        item = {"seq": row.seq, "resource": resource, "id": entity_id}
+        # An upserted row that is gone now was deleted by a later change
+        if (resource, entity_id) in data:
+            item.update(op="upsert", data=data[(resource, entity_id)])
+        else:
+            item["op"] = "delete"
+        results.append(item)
+    return results, rows[-1].seq if rows else since, more
+
+def compact_changes(connection, before):
+    # The newest entry always stays so the feed keeps its position
+    newest = db.select(db.func.max(Change.seq)).scalar_subquery()
+    result = connection.execute(
+        db.delete(Change).where(Change.created_at < before, Change.seq < newest)
+    )
+    bump_version(connection, Change.__tablename__)
+    return result.rowcount
+
+@click.command('compact-changes')
+@click.option('--days', type=int, help='Keep this many days of changes (default CHANGE_LOG_RETENTION_DAYS).')
+@with_appcontext
+def compact_changes_command(days):
+    """Delete old entries of the change feed."""
+    days = current_app.config['CHANGE_LOG_RETENTION_DAYS'] if days is None else days
+    removed = compact_changes(db.session.connection(), utcnow() - timedelta(days=days))
+    db.session.commit()
+    click.echo("Removed %d changes older than %d days" % (removed, days))
@@ -0,0 +1,84 @@
+import gzip
+import zlib
+from flask import request, current_app
+
+# gzip/deflate of the responses, negotiated with Accept-Encoding. Bodies built in
+# memory are compressed when they reach COMPRESS_MIN_SIZE bytes; streamed bodies
+# (?stream=1) are compressed chunk by chunk as they are sent, never buffered.
+#
+# Responses that already have a Content-Encoding (the gzipped snapshots) are left
+# alone. A compressed body gets the weak form of the ETag (W/"..."): a strong one
+# must change with the bytes, while If-None-Match compares weakly and still gives
+# 304s. Vary: Accept-Encoding keeps caches from serving one encoding to a client
+# that asked for another.
+
+COMPRESSIBLE = ('application/json', 'application/x-ndjson', 'application/xml',
+                'application/javascript', 'text/')
+
+# wbits: gzip container, or the zlib format HTTP calls "deflate"
+WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+def _compressible(response):
+    return (response.mimetype or '').startswith(COMPRESSIBLE)
+
+def _compress_stream(chunks, encoding, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, WBITS[encoding])
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            # zlib hands data back once it has a block's worth, memory stays flat
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        # Ends stream_with_context's request context when the client goes away
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def _weaken(response):
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+def compress_response(response):
+    config = current_app.config
+    if not _compressible(response) and response.status_code != 304:
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code == 304:
+        # Same validator as the 200 the client holds
+        etag = response.get_etag()[0]
+        if etag and request.if_none_match.is_weak(etag):
+            _weaken(response)
+        return response
+
+    if (response.status_code < 200 or response.status_code in (204, 206)
+            or 'Content-Encoding' in response.headers
+            or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+    encoding = request.accept_encodings.best_match(tuple(WBITS))
+    if encoding is None:
+        return response
+
+    level = config['COMPRESS_LEVEL']
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        if encoding == 'gzip':
+            data = gzip.compress(data, compresslevel=level, mtime=0)
+        else:
+            data = zlib.compress(data, level)
+        response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    _weaken(response)
+    return response
+
+def setup_compression(app):
+    if app.config['COMPRESS']:
+        app.after_request(compress_response)
@@ -0,0 +1,103 @@
+import json
+from flask import g, request
+from models import db, People, Planet, Starship, Vehicle, Favorite
+from utils import APIException
+
+# ?expand=<name>,... embeds the rows a collection references instead of making the
+# client fetch them one by one:
+#
+#   /people?expand=homeworld          homeworld (a planet name) -> the planet, or null
+#   /users/favorites?expand=planet    the planet is embedded, the others are {"id": n}
+#
+# References are resolved through a per-request Loader: the keys of a whole page (or
+# stream batch) are collected first and fetched with one IN (...) query per model.
+
+# model -> expand name -> (column holding the reference, related model, related column)
+EXPANSIONS = {
+    People: {'homeworld': ('homeworld', Planet, 'name')},
+    Favorite: {
+        'people': ('people_id', People, 'id'),
+        'planet': ('planet_id', Planet, 'id'),
+        'vehicle': ('vehicle_id', Vehicle, 'id'),
+        'starship': ('starship_id', Starship, 'id'),
+    },
+}
+
+class Loader:
+    def __init__(self, model, column):
+        self.model = model
+        self.column = column
+        self.found = {}
+
+    # Serialized rows by key, None for keys with no row
+    def load(self, keys):
+        missing = {key for key in keys if key is not None and key not in self.found}
+        if missing:
+            column = getattr(self.model, self.column)
+            stmt = db.select(self.model).where(column.in_(missing)).order_by(self.model.id)
+            for entity in db.session.scalars(stmt):
+                # Names are not unique: the oldest row wins
+                self.found.setdefault(getattr(entity, self.column), entity.serialize())
+            for key in missing:
+                self.found.setdefault(key, None)
+        return self.found
+
+# One loader per related model and column for the whole request
+def loader(model, column):
+    loaders = g.setdefault('loaders', {})
+    if (model, column) not in loaders:
+        loaders[(model, column)] = Loader(model, column)
+    return loaders[(model, column)]
+
+def parse_expand(model, default=()):
+    raw = request.args.get('expand')
+    if raw is None:
+        return list(default)
+    names = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in names if name not in EXPANSIONS.get(model, {})]
+    if unknown:
+        raise APIException("Cannot expand: " + ", ".join(unknown), status_code=400)
+    return names
+
+# For @conditional: the related tables an expanded response also depends on
+def expanded_tables(model, default=()):
+    def tables():
+        return [EXPANSIONS[model][name][1].__tablename__ for name in parse_expand(model, default)]
+    return tables
+
+# The fields plus the columns the expansions read
+def with_references(model, fields, names):
+    fields = list(fields)
+    for name in names:
+        source = EXPANSIONS[model][name][0]
+        if source not in fields:
+            fields.append(source)
+    return fields
+
+def expand(model, items, names):
+    for name in names:
+        source, related, column = EXPANSIONS[model][name]
+        found = loader(related, column).load({item[source] for item in items})
+        for item in items:
+            item[name] = found.get(item[source])
+    return items
+
+# Encoder for serializers.page_response and utils.stream_collection: the same
+# compact, key-sorted JSON as row_serializer, with the expansions embedded
+def row_encoder(model, fields, names):
+    def encode(rows):
+        items = expand(model, [dict(zip(fields, row)) for row in rows], names)
+        return [json.dumps(item, sort_keys=True, separators=(',', ':')) for item in items]
+    return encode
+
+# fields: the fields of the embedded entities by model (utils.parse_embedded_fields)
+def favorite_items(rows, names, fields):
+    items = expand(Favorite, [row._asdict() for row in rows], names)
+    for item in items:
+        for kind, (source, related, column) in EXPANSIONS[Favorite].items():
+            entity_id = item.pop(source)
+            if kind not in names:
+                item[kind] = {"id": entity_id} if entity_id is not None else None
+            elif item[kind] is not None:
+                item[kind] = {field: item[kind][field] for field in fields[related]}
+    return items
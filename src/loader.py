@@ -0,0 +1,170 @@
+import csv
+import io
+import json
+import os
+import time
+import click
+from flask.cli import with_appcontext
+from models import db, bump_version, log_changes, shadow_columns, fill_numeric, People, Planet, Starship, Vehicle
+from bulk import writable_fields
+
+RESOURCES = {
+    'people': People,
+    'planets': Planet,
+    'starships': Starship,
+    'vehicles': Vehicle,
+}
+
+# Readers: each one yields one dict per record without loading the whole file
+
+def iter_ndjson(fp):
+    for line in fp:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def iter_csv(fp):
+    for row in csv.DictReader(fp):
+        yield row
+
+# Incremental parser for a top-level JSON array of objects
+def iter_json_array(fp, chunk_size=1 << 16):
+    decoder = json.JSONDecoder()
+    buffer = fp.read(chunk_size)
+    start = buffer.find('[')
+    if start < 0:
+        raise click.ClickException("Expected a JSON array of objects")
+    buffer = buffer[start + 1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                raise click.ClickException("Truncated JSON input")
+            buffer += chunk
+            continue
+        yield obj
+        buffer = buffer[end:]
+
+READERS = {
+    'ndjson': iter_ndjson,
+    'jsonl': iter_ndjson,
+    'csv': iter_csv,
+    'json': iter_json_array,
+}
+
+# Empty strings (CSV) become NULL, other values such as 0 are kept
+def _value(value):
+    return None if value is None or value == '' else value
+
+# With upsert, a name is in a batch once (the last record wins): the statements that
+# apply a batch only match names that are already in the table
+def iter_batches(records, fields, batch_size, upsert=False):
+    batch = {}
+    for record in records:
+        row = {field: _value(record.get(field)) for field in fields}
+        if not row.get('name'):
+            continue
+        key = row['name'] if upsert else len(batch)
+        batch.pop(key, None)
+        batch[key] = row
+        if len(batch) >= batch_size:
+            yield list(batch.values())
+            batch = {}
+    if batch:
+        yield list(batch.values())
+
+# SQLite and other dialects: one executemany INSERT (and UPDATE for upserts) per batch
+
+def load_executemany(connection, table, fields, batch, upsert):
+    if upsert:
+        names = [row['name'] for row in batch]
+        existing = dict(connection.execute(
+            db.select(table.c.name, table.c.id).where(table.c.name.in_(names))
+        ).all())
+        updates = [dict(row, _id=existing[row['name']]) for row in batch if row['name'] in existing]
+        batch = [row for row in batch if row['name'] not in existing]
+        if updates:
+            connection.execute(table.update().where(table.c.id == db.bindparam('_id')), updates)
+    if batch:
+        connection.execute(table.insert(), batch)
+
+# PostgreSQL: COPY the batch as CSV; upserts go through a temp table
+
+def _copy(cursor, target, fields, batch):
+    buffer = io.StringIO()
+    # Quoting every string keeps '' distinct from NULL (an unquoted empty field)
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for row in batch:
+        writer.writerow([row[field] for field in fields])
+    buffer.seek(0)
+    cursor.copy_expert(
+        'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (target, ', '.join(fields)),
+        buffer,
+    )
+
+def load_copy(connection, table, fields, batch, upsert):
+    cursor = connection.connection.cursor()
+    if not upsert:
+        _copy(cursor, '"%s"' % table.name, fields, batch)
+        return
+
+    staging = '_load_' + table.name
+    cursor.execute('CREATE TEMP TABLE IF NOT EXISTS %s (LIKE "%s" INCLUDING DEFAULTS) ON COMMIT DROP'
+                   % (staging, table.name))
+    _copy(cursor, staging, fields, batch)
+    assignments = ', '.join('%s = s.%s' % (field, field) for field in fields if field != 'name')
+    cursor.execute('UPDATE "%s" t SET %s FROM %s s WHERE t.name = s.name'
+                   % (table.name, assignments, staging))
+    columns = ', '.join(fields)
+    cursor.execute('INSERT INTO "%s" (%s) SELECT %s FROM %s s WHERE NOT EXISTS '
+                   '(SELECT 1 FROM "%s" t WHERE t.name = s.name)'
+                   % (table.name, columns, columns, staging, table.name))
+
+@click.command('load-data')
+@click.argument('resource', type=click.Choice(sorted(RESOURCES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(sorted(READERS)),
+              help='Input format. Defaults to the file extension.')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per transaction.')
+@click.option('--upsert', is_flag=True, help='Update rows that already exist with the same name.')
+@with_appcontext
+def load_data_command(resource, path, file_format, batch_size, upsert):
+    """Load people, planets, starships or vehicles from a JSON, NDJSON or CSV dump."""
+    model = RESOURCES[resource]
+    table = model.__table__
+    fields = writable_fields(model)
+    file_format = file_format or os.path.splitext(path)[1].lstrip('.').lower()
+    if file_format not in READERS:
+        raise click.ClickException("Unknown format %r, use --format" % file_format)
+
+    connection = db.session.connection()
+    load = load_copy if connection.dialect.name == 'postgresql' else load_executemany
+
+    loaded = 0
+    started = time.monotonic()
+    with open(path, newline='', encoding='utf-8') as fp:
+        for batch in iter_batches(READERS[file_format](fp), fields, batch_size, upsert):
+            for row in batch:
+                fill_numeric(model, row)
+            connection = db.session.connection()
+            load(connection, table, fields + shadow_columns(model), batch, upsert)
+            bump_version(connection, table.name)
+            db.session.commit()
+
+            loaded += len(batch)
+            elapsed = time.monotonic() - started
+            click.echo("%s: %d rows loaded (%.0f rows/sec)" % (resource, loaded, loaded / elapsed if elapsed else 0))
+
+    # Rows loaded this way are not in the change feed: make /changes clients resync
+    connection = db.session.connection()
+    bump_version(connection, table.name)
+    log_changes(connection, table.name, 'resync', [None])
+    db.session.commit()
+
+    elapsed = time.monotonic() - started
+    click.echo("Done: %d rows in %.1fs" % (loaded, elapsed))
@@ -0,0 +1,83 @@
+import os
+import time
+from flask import request, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from prometheus_client import (Counter, Gauge, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST,
+                               REGISTRY, generate_latest, multiprocess)
+
+# Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR (see
+# gunicorn.conf.py) and /metrics merges them, so any worker can answer a scrape.
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency', ['method', 'endpoint'],
+)
+REQUEST_COUNT = Counter(
+    'http_requests_total', 'Requests by status code', ['method', 'endpoint', 'status'],
+)
+IN_FLIGHT = Gauge(
+    'http_requests_in_progress', 'Requests being served', multiprocess_mode='livesum',
+)
+DB_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL statements run per request', ['endpoint'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, float('inf')),
+)
+DB_TIME = Histogram(
+    'http_request_db_seconds', 'Time spent in SQL per request', ['endpoint'],
+)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + elapsed
+
+def _endpoint():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+def _registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+def setup_metrics(app):
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_request(response):
+        if 'request_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_started
+        endpoint = _endpoint()
+        db_queries = g.get('db_queries', 0)
+        db_time = g.get('db_time', 0.0)
+
+        REQUEST_LATENCY.labels(request.method, endpoint).observe(elapsed)
+        REQUEST_COUNT.labels(request.method, endpoint, response.status_code).inc()
+        DB_QUERIES.labels(endpoint).observe(db_queries)
+        DB_TIME.labels(endpoint).observe(db_time)
+
+        # Streamed bodies are produced after this point, so "app" only covers the handler
+        response.headers['Server-Timing'] = 'db;dur=%.2f;desc="%d queries", app;dur=%.2f, total;dur=%.2f' % (
+            db_time * 1000, db_queries, (elapsed - db_time) * 1000, elapsed * 1000,
+        )
+        return response
+
+    @app.teardown_request
+    def stop_timer(exc):
+        if g.pop('request_started', None) is not None:
+            IN_FLIGHT.dec()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return generate_latest(_registry()), 200, {'Content-Type': CONTENT_TYPE_LATEST}
@@ -1,6 +1,11 @@
+import re
+from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Tabla de Usuarios
 class User(db.Model):
@@ -10,6 +15,9 @@ class User(db.Model):
     password = db.Column(db.String(80), nullable=False)
     is_active = db.Column(db.Boolean(), unique=False, nullable=False)
 
+    # Columns that serialize() never exposes
+    private_fields = ('password',)
+
     def serialize(self):
         return {
             "id": self.id,
@@ -20,13 +28,22 @@ class User(db.Model):
 # Tabla de Personajes
 class People(db.Model):
     __tablename__ = 'people'
+    __table_args__ = (
+        # LIKE 'prefix%' on PostgreSQL only uses an index built with pattern ops
+        db.Index('ix_people_name_pattern', 'name', postgresql_ops={'name': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(120), nullable=False)
-    gender = db.Column(db.String(50))
+    name = db.Column(db.String(120), nullable=False, index=True)
+    gender = db.Column(db.String(50), index=True)
     birth_year = db.Column(db.String(20))
     height = db.Column(db.String(20))
     mass = db.Column(db.String(20))
-    homeworld = db.Column(db.String(100))
+    homeworld = db.Column(db.String(100), index=True)
+    # Parsed copies of the numeric string columns (see numeric_fields)
+    height_num = db.Column(db.Float, index=True)
+    mass_num = db.Column(db.Float, index=True)
+
+    numeric_fields = ('height', 'mass')
 
     def serialize(self):
         return {
@@ -42,12 +59,19 @@ class People(db.Model):
 # Tabla de Planetas
 class Planet(db.Model):
     __tablename__ = 'planet'
+    __table_args__ = (
+        db.Index('ix_planet_name_pattern', 'name', postgresql_ops={'name': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(120), nullable=False)
-    climate = db.Column(db.String(120))
+    name = db.Column(db.String(120), nullable=False, index=True)
+    climate = db.Column(db.String(120), index=True)
     population = db.Column(db.String(120))
-    terrain = db.Column(db.String(120))
+    terrain = db.Column(db.String(120), index=True)
     gravity = db.Column(db.String(120))
+    population_num = db.Column(db.Float, index=True)
+    gravity_num = db.Column(db.Float, index=True)
+
+    numeric_fields = ('population', 'gravity')
 
     def serialize(self):
         return {
@@ -62,12 +86,19 @@ class Planet(db.Model):
 # Tabla de Vehículos
 class Vehicle(db.Model):
     __tablename__ = 'vehicle'
+    __table_args__ = (
+        db.Index('ix_vehicle_name_pattern', 'name', postgresql_ops={'name': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(120), nullable=False)
-    model = db.Column(db.String(120))
-    manufacturer = db.Column(db.String(120))
+    name = db.Column(db.String(120), nullable=False, index=True)
+    model = db.Column(db.String(120), index=True)
+    manufacturer = db.Column(db.String(120), index=True)
     cost_in_credits = db.Column(db.String(120))
     max_atmosphering_speed = db.Column(db.String(120))
+    cost_in_credits_num = db.Column(db.Float, index=True)
+    max_atmosphering_speed_num = db.Column(db.Float, index=True)
+
+    numeric_fields = ('cost_in_credits', 'max_atmosphering_speed')
 
     def serialize(self):
         return {
@@ -82,12 +113,18 @@ class Vehicle(db.Model):
 # Tabla de Naves Espaciales
 class Starship(db.Model):
     __tablename__ = 'starship'
+    __table_args__ = (
+        db.Index('ix_starship_name_pattern', 'name', postgresql_ops={'name': 'varchar_pattern_ops'}).ddl_if(dialect='postgresql'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(120), nullable=False)
+    name = db.Column(db.String(120), nullable=False, index=True)
     model = db.Column(db.String(120))
-    manufacturer = db.Column(db.String(120))
-    starship_class = db.Column(db.String(120))
+    manufacturer = db.Column(db.String(120), index=True)
+    starship_class = db.Column(db.String(120), index=True)
     hyperdrive_rating = db.Column(db.String(120))
+    hyperdrive_rating_num = db.Column(db.Float, index=True)
+
+    numeric_fields = ('hyperdrive_rating',)
 
     def serialize(self):
         return {
@@ -102,12 +139,19 @@ class Starship(db.Model):
 # Tabla de Favoritos
 class Favorite(db.Model):
     __tablename__ = 'favorite'
+    # A user can favorite each entity only once
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'people_id', name='uq_favorite_user_people'),
+        db.UniqueConstraint('user_id', 'planet_id', name='uq_favorite_user_planet'),
+        db.UniqueConstraint('user_id', 'vehicle_id', name='uq_favorite_user_vehicle'),
+        db.UniqueConstraint('user_id', 'starship_id', name='uq_favorite_user_starship'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    people_id = db.Column(db.Integer, db.ForeignKey('people.id'), nullable=True)
-    planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'), nullable=True)
-    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'), nullable=True)
-    starship_id = db.Column(db.Integer, db.ForeignKey('starship.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
+    people_id = db.Column(db.Integer, db.ForeignKey('people.id'), nullable=True, index=True)
+    planet_id = db.Column(db.Integer, db.ForeignKey('planet.id'), nullable=True, index=True)
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'), nullable=True, index=True)
+    starship_id = db.Column(db.Integer, db.ForeignKey('starship.id'), nullable=True, index=True)
 
     user = db.relationship('User', backref='favorites')
     people = db.relationship('People')
@@ -124,3 +168,128 @@ class Favorite(db.Model):
             "vehicle": self.vehicle.serialize() if self.vehicle else None,
             "starship": self.starship.serialize() if self.starship else None
         }
+
+# Columns a client can see (and ask for with ?fields=), in table order
+def public_fields(model):
+    private = getattr(model, 'private_fields', ()) + tuple(shadow_columns(model))
+    return [column.name for column in model.__table__.columns if column.name not in private]
+
+# Numeric string columns ("1,358", "1 standard", "unknown") have a <column>_num Float
+# copy with the leading number, or NULL when there is none, for range filters and /stats
+def shadow_columns(model):
+    return [field + '_num' for field in getattr(model, 'numeric_fields', ())]
+
+NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+def parse_number(value):
+    if value is None:
+        return None
+    match = NUMBER.match(str(value).replace(',', '').strip())
+    return float(match.group()) if match else None
+
+# Adds the shadow values for the numeric fields present in a row dict (Core writes)
+def fill_numeric(model, row):
+    for field in getattr(model, 'numeric_fields', ()):
+        if field in row:
+            row[field + '_num'] = parse_number(row[field])
+    return row
+
+# ORM writes: keep the shadow columns in line with their string column
+@event.listens_for(db.Model, 'before_insert', propagate=True)
+@event.listens_for(db.Model, 'before_update', propagate=True)
+def update_numeric(mapper, connection, target):
+    for field in getattr(target, 'numeric_fields', ()):
+        setattr(target, field + '_num', parse_number(getattr(target, field)))
+
+# Objects that exist in the database but not in the models (the full-text search index
+# in search.py) or only on PostgreSQL; keep `flask db migrate` from touching them
+def include_object(obj, name, type_, reflected, compare_to):
+    if type_ == 'table' and name.startswith('search_index'):
+        return False
+    if name == 'search_vector' or (type_ == 'index' and name.endswith(('_search_vector', '_name_pattern'))):
+        return False
+    return True
+
+# Version counter per table, used to build ETags without reading the rows
+class TableVersion(db.Model):
+    __tablename__ = 'table_version'
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# Facts about the database itself, one row per key (snapshots.database_id)
+class DatabaseInfo(db.Model):
+    __tablename__ = 'database_info'
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.String(100), nullable=False)
+
+def bump_version(connection, *tables):
+    table = TableVersion.__table__
+    # Writers of tracked tables also lock the change_log row, so change seqs are
+    # committed in order and a client never skips past one still in flight
+    tables = set(tables)
+    if tables & set(CHANGE_TRACKED):
+        tables.add(Change.__tablename__)
+    for name in sorted(tables):
+        result = connection.execute(
+            table.update().where(table.c.table_name == name).values(version=table.c.version + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(table_name=name, version=1))
+
+# Tables written in the current transaction, for work that runs after the commit (snapshots.py)
+def mark_changed(session, *tables):
+    session.info.setdefault('changed_tables', set()).update(tables)
+
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Tables whose writes are recorded for GET /changes
+CHANGE_TRACKED = ('people', 'planet', 'starship', 'vehicle')
+
+# Change feed (see changes.py): one row per created/updated ("upsert") or deleted
+# entity, plus "resync" markers after bulk loads
+class Change(db.Model):
+    __tablename__ = 'change_log'
+    __table_args__ = {'sqlite_autoincrement': True}
+    seq = db.Column(db.Integer, primary_key=True)
+    resource = db.Column(db.String(50), nullable=False)
+    entity_id = db.Column(db.Integer)
+    op = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow, index=True)
+
+def log_changes(connection, resource, op, ids):
+    if resource in CHANGE_TRACKED and ids:
+        connection.execute(Change.__table__.insert(),
+                           [{"resource": resource, "entity_id": entity_id, "op": op} for entity_id in ids])
+
+def get_versions(*tables):
+    rows = db.session.query(TableVersion).filter(TableVersion.table_name.in_(tables)).all()
+    versions = {row.table_name: row.version for row in rows}
+    return [versions.get(name, 0) for name in tables]
+
+# Every ORM write bumps the version of the tables it touches, in the same transaction
+@event.listens_for(Session, 'before_flush')
+def bump_changed_tables(session, flush_context, instances):
+    changed = set()
+    for obj in list(session.new) + list(session.deleted):
+        changed.add(obj.__table__.name)
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            changed.add(obj.__table__.name)
+    changed.discard(TableVersion.__tablename__)
+    if changed:
+        bump_version(session.connection(), *sorted(changed))
+        mark_changed(session, *changed)
+
+# Record ORM writes in the change feed, in the same transaction. Runs after the flush
+# so new rows have their ids; session.new/dirty/deleted still hold what was flushed.
+@event.listens_for(Session, 'after_flush')
+def log_changed_entities(session, flush_context):
+    changes = {}
+    upserted = list(session.new) + [obj for obj in session.dirty if session.is_modified(obj)]
+    for op, objs in (('upsert', upserted), ('delete', session.deleted)):
+        for obj in objs:
+            if obj.__table__.name in CHANGE_TRACKED:
+                changes.setdefault((obj.__table__.name, op), []).append(obj.id)
+    for (resource, op), ids in sorted(changes.items()):
+        log_changes(session.connection(), resource, op, ids)
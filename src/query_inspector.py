@@ -0,0 +1,82 @@
+import logging
+import re
+import time
+from collections import Counter
+from flask import request, g, current_app, has_app_context, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('query_inspector')
+
+# Opt-in SQL instrumentation for development, staging and tests (SQL_INSTRUMENTATION=1):
+# - statements slower than SLOW_QUERY_MS are logged with their EXPLAIN plan
+# - a request that runs the same statement more than N_PLUS_ONE_THRESHOLD times is
+#   logged as a likely N+1, and fails with NPlusOneError when N_PLUS_ONE_RAISE=1
+
+class NPlusOneError(Exception):
+    pass
+
+def normalize(statement):
+    statement = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    statement = re.sub(r'\b\d+\b', '?', statement)
+    statement = re.sub(r'%\(\w+\)s|:\w+|\$\d+', '?', statement)
+    statement = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?)', statement)
+    return ' '.join(statement.split())
+
+def explain(conn, statement, parameters):
+    if conn.dialect.name == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif conn.dialect.name == 'postgresql':
+        prefix = 'EXPLAIN '
+    else:
+        return None
+    # A separate DBAPI cursor, the one being inspected still holds the results
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    except Exception as error:
+        return 'EXPLAIN failed: %s' % error
+    finally:
+        cursor.close()
+
+# Registered once for every engine; they only act for apps with SQL_INSTRUMENTATION
+# on, so creating several apps (tests, the lazy admin) never counts a statement twice
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('inspector_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['inspector_started'].pop()
+    if not has_app_context() or not current_app.config['SQL_INSTRUMENTATION']:
+        return
+    if has_request_context():
+        g.setdefault('statement_counts', Counter())[normalize(statement)] += 1
+
+    if elapsed >= current_app.config['SLOW_QUERY_MS'] / 1000.0:
+        plan = None
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            plan = explain(conn, statement, parameters)
+        logger.warning('Slow query (%.1f ms): %s\nParameters: %r\nPlan:\n%s',
+                       elapsed * 1000, statement, parameters, plan)
+
+def setup_query_inspector(app):
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+    threshold = app.config['N_PLUS_ONE_THRESHOLD']
+    raise_on_n_plus_one = app.config['N_PLUS_ONE_RAISE']
+
+    @app.after_request
+    def check_n_plus_one(response):
+        counts = g.get('statement_counts')
+        if not counts:
+            return response
+        repeated = [(statement, count) for statement, count in counts.items() if count > threshold]
+        for statement, count in repeated:
+            logger.warning('Possible N+1 in %s %s: statement ran %d times: %s',
+                           request.method, request.path, count, statement)
+        if repeated and raise_on_n_plus_one:
+            raise NPlusOneError('%s %s ran the same statement %d times: %s' % (
+                request.method, request.path, repeated[0][1], repeated[0][0]))
+        return response
@@ -0,0 +1,98 @@
+import itertools
+import logging
+import threading
+import time
+from flask import request, current_app, has_request_context, g
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+
+logger = logging.getLogger('replicas')
+
+# Optional read replicas (DATABASE_REPLICA_URLS, comma separated):
+# - GET/HEAD requests read from a replica, chosen round-robin once per request so
+#   the table versions behind the ETag and the rows come from the same replica
+# - a replica that fails to connect or drops connections is skipped for
+#   REPLICA_RETRY_SECONDS, and reads go to the primary when every replica is down
+# - writes, CLI commands and everything outside a request use the primary
+# - after a successful write the client gets a short-lived cookie that keeps its
+#   reads on the primary (read-your-writes) while the replicas catch up
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_COOKIE = 'read_primary'
+
+class ReplicaSet:
+    def __init__(self, engines, retry_after=30):
+        self.engines = engines
+        self.retry_after = retry_after
+        self._down_until = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        for engine in engines:
+            # Async engines report errors through their sync_engine
+            event.listen(getattr(engine, 'sync_engine', engine), 'handle_error', self._on_error)
+
+    def choose(self):
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            engine = self.engines[next(self._counter) % len(self.engines)]
+            if self._down_until.get(engine, 0) <= now:
+                return engine
+        return None
+
+    def eject(self, engine):
+        with self._lock:
+            self._down_until[engine] = time.monotonic() + self.retry_after
+        logger.warning('Replica %s ejected for %ss', engine.url.render_as_string(hide_password=True),
+                       self.retry_after)
+
+    def _on_error(self, context):
+        # No connection means the connect itself failed
+        if context.is_disconnect or context.connection is None:
+            for engine in self.engines:
+                if getattr(engine, 'sync_engine', engine) is context.engine:
+                    self.eject(engine)
+
+    def status(self):
+        now = time.monotonic()
+        return [{"url": engine.url.render_as_string(hide_password=True),
+                 "healthy": self._down_until.get(engine, 0) <= now} for engine in self.engines]
+
+def read_from_replica():
+    return (has_request_context() and request.method in SAFE_METHODS
+            and STICKY_COOKIE not in request.cookies)
+
+# The replica of the current request (None: the primary)
+def request_replica(replicas):
+    if 'replica' not in g:
+        g.replica = replicas.choose()
+    return g.replica
+
+# Session class for Flask-SQLAlchemy that sends the reads of safe requests to a replica
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and read_from_replica():
+            replicas = current_app.extensions.get('replicas')
+            engine = request_replica(replicas) if replicas else None
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def replica_urls(value):
+    return [url.strip().replace("postgres://", "postgresql://") for url in (value or '').split(',') if url.strip()]
+
+def setup_replicas(app):
+    urls = app.config['DATABASE_REPLICA_URLS']
+    if not urls:
+        return
+    engine_options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    app.extensions['replicas'] = ReplicaSet(
+        [create_engine(url, **engine_options) for url in urls],
+        retry_after=app.config['REPLICA_RETRY_SECONDS'],
+    )
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=app.config['REPLICA_STICKY_SECONDS'],
+                                httponly=True, samesite='Lax')
+        return response
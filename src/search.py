@@ -0,0 +1,129 @@
+import re
+from sqlalchemy import event, DDL
+from models import db, People, Planet, Starship, Vehicle
+
+# Searchable tables: (model, slot, title column, other columns). On SQLite every row of
+# every table lives in one FTS5 table under rowid = id * 4 + slot, so triggers can
+# update and delete it by rowid. On PostgreSQL each table gets a generated tsvector
+# column with a GIN index.
+SEARCHABLE = [
+    (People, 0, 'name', []),
+    (Planet, 1, 'name', ['terrain', 'climate']),
+    (Starship, 2, 'name', ['model', 'manufacturer']),
+    (Vehicle, 3, 'name', ['manufacturer']),
+]
+MODELS = {model.__tablename__: model for model, slot, title, columns in SEARCHABLE}
+
+def _body(columns, prefix=''):
+    if not columns:
+        return "''"
+    return " || ' ' || ".join("coalesce(%s%s, '')" % (prefix, column) for column in columns)
+
+def sqlite_ddl():
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "resource UNINDEXED, entity_id UNINDEXED, title, body, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    ]
+    for model, slot, title, columns in SEARCHABLE:
+        table = model.__tablename__
+        insert = (
+            "INSERT INTO search_index (rowid, resource, entity_id, title, body) "
+            "VALUES (new.id * 4 + %d, '%s', new.id, new.%s, %s);" % (slot, table, title, _body(columns, 'new.'))
+        )
+        delete = "DELETE FROM search_index WHERE rowid = old.id * 4 + %d;" % slot
+        statements += [
+            "CREATE TRIGGER IF NOT EXISTS %s_search_insert AFTER INSERT ON %s BEGIN %s END" % (table, table, insert),
+            "CREATE TRIGGER IF NOT EXISTS %s_search_update AFTER UPDATE ON %s BEGIN %s %s END" % (table, table, delete, insert),
+            "CREATE TRIGGER IF NOT EXISTS %s_search_delete AFTER DELETE ON %s BEGIN %s END" % (table, table, delete),
+        ]
+    return statements
+
+def postgresql_ddl():
+    statements = []
+    for model, slot, title, columns in SEARCHABLE:
+        table = model.__tablename__
+        vector = "setweight(to_tsvector('simple', coalesce(%s, '')), 'A')" % title
+        if columns:
+            vector += " || setweight(to_tsvector('simple', %s), 'B')" % _body(columns)
+        statements += [
+            'ALTER TABLE "%s" ADD COLUMN IF NOT EXISTS search_vector tsvector '
+            'GENERATED ALWAYS AS (%s) STORED' % (table, vector),
+            'CREATE INDEX IF NOT EXISTS ix_%s_search_vector ON "%s" USING gin (search_vector)' % (table, table),
+        ]
+    return statements
+
+# Keep db.create_all() (tests, local sqlite) in line with the migration
+for statement in sqlite_ddl():
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in postgresql_ddl():
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+event.listen(db.metadata, 'before_drop', DDL("DROP TABLE IF EXISTS search_index").execute_if(dialect='sqlite'))
+
+def _terms(q):
+    return re.findall(r'\w+', q, re.UNICODE)
+
+def _sqlite_match(terms):
+    # Every term is quoted (no FTS syntax from user input) and prefix matched
+    return ' '.join('"%s"*' % term for term in terms)
+
+def _postgresql_query(terms):
+    return ' & '.join(term + ':*' for term in terms)
+
+def _sqlite_matches(terms, limit):
+    return db.session.execute(db.text(
+        "SELECT resource, entity_id, -bm25(search_index, 0, 0, 10.0, 1.0) AS rank "
+        "FROM search_index WHERE search_index MATCH :match ORDER BY rank DESC LIMIT :limit"
+    ), {"match": _sqlite_match(terms), "limit": limit}).all()
+
+def _postgresql_matches(terms, limit):
+    query = _postgresql_query(terms)
+    branches = [
+        "SELECT '%s' AS resource, id AS entity_id, ts_rank(search_vector, q) AS rank "
+        "FROM \"%s\", to_tsquery('simple', :query) q WHERE search_vector @@ q" % (table, table)
+        for table in MODELS
+    ]
+    return db.session.execute(db.text(
+        " UNION ALL ".join(branches) + " ORDER BY rank DESC LIMIT :limit"
+    ), {"query": query, "limit": limit}).all()
+
+# WHERE clause matching the rows of one searchable model, for callers that build their
+# own query (the admin list views). None when q has no searchable terms.
+def match_clause(model, q):
+    terms = _terms(q)
+    if not terms:
+        return None
+    if db.engine.dialect.name == 'postgresql':
+        return db.text(
+            "\"%s\".search_vector @@ to_tsquery('simple', :query)" % model.__tablename__
+        ).bindparams(query=_postgresql_query(terms))
+    return model.id.in_(db.text(
+        "SELECT entity_id FROM search_index WHERE search_index MATCH :match AND resource = :resource"
+    ).bindparams(match=_sqlite_match(terms), resource=model.__tablename__).columns(entity_id=db.Integer))
+
+# Ranked search across people, planets, starships and vehicles. Loads the matched
+# entities with one IN (...) query per table, with the fields given for each model.
+def search(q, limit, fields):
+    terms = _terms(q)
+    if not terms:
+        return []
+    if db.engine.dialect.name == 'postgresql':
+        matches = _postgresql_matches(terms, limit)
+    else:
+        matches = _sqlite_matches(terms, limit)
+
+    ids = {}
+    for resource, entity_id, rank in matches:
+        ids.setdefault(resource, []).append(entity_id)
+    entities = {}
+    for resource, entity_ids in ids.items():
+        model = MODELS[resource]
+        for entity in model.query.filter(model.id.in_(entity_ids)):
+            data = entity.serialize()
+            entities[(resource, entity.id)] = {field: data[field] for field in fields[model]}
+
+    return [
+        {"resource": resource, "id": entity_id, "rank": round(rank, 4), "data": entities[(resource, entity_id)]}
+        for resource, entity_id, rank in matches
+        if (resource, entity_id) in entities
+    ]
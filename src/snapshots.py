@@ -0,0 +1,209 @@
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from flask import current_app, request, send_file, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db, get_versions, public_fields, DatabaseInfo, People, Planet, Starship, Vehicle
+from serializers import row_serializer
+from replicas import STICKY_COOKIE
+from utils import make_etag
+
+logger = logging.getLogger('snapshots')
+
+# Pre-gzipped NDJSON snapshots of the unfiltered full-collection export
+# (GET /people?stream=1 and friends), served with send_file so the server can
+# sendfile() them without a query or serialization.
+#
+# A snapshot file is named after the table version it was built at
+# (people.<version>.ndjson.gz), so a request knows it is current from the version
+# @conditional already read. After a write commits, a rebuild runs in a background
+# thread SNAPSHOT_DEBOUNCE_SECONDS later and covers every write made in between.
+# Until it lands the previous snapshot is served for up to SNAPSHOT_MAX_STALENESS
+# seconds (never to a client that just wrote, see replicas.py), then the live query.
+#
+# Versions are small numbers that repeat across databases, so the files live in a
+# directory of their own per database (URL plus a random id kept in database_info,
+# new when the database is recreated). Files are only ever removed by version, as
+# other workers serve and build in the same directory: older than the one just
+# built, or newer than the table (a database restored to older versions).
+
+MODELS = {model.__tablename__: model for model in (People, Planet, Starship, Vehicle)}
+
+_pending = {}
+_lock = threading.Lock()
+
+_setup_lock = threading.Lock()
+
+DATABASE_ID = 'database_id'
+
+# Random id of the database, created on first use
+def database_id():
+    table = DatabaseInfo.__table__
+    query = db.select(table.c.value).where(table.c.key == DATABASE_ID)
+    with db.engine.connect() as connection:
+        found = connection.scalar(query)
+        if found is None:
+            try:
+                connection.execute(table.insert().values(key=DATABASE_ID, value=uuid.uuid4().hex))
+                connection.commit()
+            except IntegrityError:
+                # Another process created it first
+                connection.rollback()
+            found = connection.scalar(query)
+    return found
+
+def _directory():
+    state = current_app.extensions.setdefault('snapshots', {})
+    with _setup_lock:
+        if 'directory' not in state:
+            root = current_app.config['SNAPSHOT_DIR']
+            key = '%s|%s' % (current_app.config['SQLALCHEMY_DATABASE_URI'], database_id())
+            directory = os.path.join(root, hashlib.sha1(key.encode()).hexdigest()[:16])
+            os.makedirs(directory, exist_ok=True)
+            state['directory'] = directory
+    return state['directory']
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        # Removed by another worker
+        pass
+
+def _path(table, version):
+    return os.path.join(_directory(), '%s.%d.ndjson.gz' % (table, version))
+
+def _snapshots(table):
+    found = {}
+    for path in glob.glob(os.path.join(_directory(), '%s.*.ndjson.gz' % table)):
+        version = os.path.basename(path).split('.')[1]
+        if version.isdigit():
+            found[int(version)] = path
+    return found
+
+def _stale_marker(table):
+    return os.path.join(_directory(), '%s.stale' % table)
+
+def build(model):
+    table = model.__tablename__
+    directory = _directory()
+    version = get_versions(table)[0]
+    fields = tuple(public_fields(model))
+    serialize = row_serializer(model, fields)
+    stmt = (db.select(*[getattr(model, field) for field in fields]).order_by(model.id)
+            .execution_options(yield_per=current_app.config['STREAM_BATCH_SIZE']))
+
+    # Written next to the target and renamed, readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.%s.' % table)
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            with gzip.GzipFile(fileobj=fp, mode='wb', mtime=0,
+                               compresslevel=current_app.config['SNAPSHOT_GZIP_LEVEL']) as gz:
+                for row in db.session.execute(stmt):
+                    gz.write((serialize(row) + "\n").encode())
+        os.replace(tmp_path, _path(table, version))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    for old_version, path in _snapshots(table).items():
+        if old_version < version:
+            _unlink(path)
+    if get_versions(table)[0] == version:
+        try:
+            os.unlink(_stale_marker(table))
+        except FileNotFoundError:
+            pass
+    else:
+        # Written to while building
+        schedule(table)
+    db.session.rollback()
+    return version
+
+def _run(app, table):
+    with _lock:
+        _pending.pop(table, None)
+    with app.app_context():
+        try:
+            build(MODELS[table])
+        except Exception:
+            logger.exception('Rebuilding the %s snapshot failed', table)
+
+# Rebuild a table's snapshot soon. Calls made while one is pending are merged into it
+# (a fixed delay rather than one that restarts, so steady writes can't starve it).
+def schedule(table):
+    if table not in MODELS or not current_app.config['SNAPSHOTS']:
+        return
+    try:
+        # Created once, its mtime is when the snapshot went stale
+        os.close(os.open(_stale_marker(table), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        pass
+    with _lock:
+        if table in _pending:
+            return
+        timer = threading.Timer(current_app.config['SNAPSHOT_DEBOUNCE_SECONDS'], _run,
+                                (current_app._get_current_object(), table))
+        timer.daemon = True
+        _pending[table] = timer
+    timer.start()
+
+def _stale_for(table):
+    try:
+        return time.time() - os.path.getmtime(_stale_marker(table))
+    except FileNotFoundError:
+        return 0
+
+# The snapshot response for an unfiltered export, or None to run the live query
+def serve(model):
+    config = current_app.config
+    if not config['SNAPSHOTS'] or set(request.args) - {'stream'} or 'gzip' not in request.accept_encodings:
+        return None
+
+    table = model.__tablename__
+    current = g.get('table_versions', {}).get(table)
+    if current is None:
+        current = get_versions(table)[0]
+    snapshots = _snapshots(table)
+    for version in [version for version in snapshots if version > current]:
+        # Built before the database went back to an older version
+        _unlink(snapshots.pop(version))
+    version = current
+    if current not in snapshots:
+        schedule(table)
+        if (not snapshots or STICKY_COOKIE in request.cookies
+                or _stale_for(table) > config['SNAPSHOT_MAX_STALENESS']):
+            return None
+        version = max(snapshots)
+
+    try:
+        response = send_file(snapshots[version], mimetype='application/x-ndjson',
+                             etag=False, conditional=False, max_age=None)
+    except FileNotFoundError:
+        # Replaced by a newer build in the meantime
+        return None
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    # Weak: the bytes differ from the identity and the live gzip bodies of the version
+    response.set_etag(make_etag((table,), [version]), weak=True)
+    return response
+
+# Writes made through the session schedule a rebuild once they are committed
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    tables = session.info.pop('changed_tables', ())
+    if has_app_context():
+        for table in sorted(tables):
+            schedule(table)
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('changed_tables', None)
@@ -0,0 +1,90 @@
+from flask import request, current_app
+from models import db, People, Planet, Starship, Vehicle
+from utils import APIException, apply_filters
+
+# GET /stats/<resource>: count, min, max, avg and an equal-width histogram of the
+# numeric fields, computed in the database from the <field>_num columns.
+#
+#   /stats/people?fields=height,mass&buckets=5
+#   /stats/planets?range[population]=1000000,&filter[climate]=arid
+#
+# range[field]=low,high keeps rows with low <= value <= high (either end may be
+# empty); filter[...] works as on the collection endpoints.
+
+RESOURCES = {
+    'people': People,
+    'planets': Planet,
+    'starships': Starship,
+    'vehicles': Vehicle,
+}
+
+def _number(value, field):
+    try:
+        return float(value)
+    except ValueError:
+        raise APIException("range[%s] needs numbers: low,high" % field, status_code=400)
+
+def apply_ranges(stmt, model):
+    for key, value in request.args.items():
+        if not (key.startswith('range[') and key.endswith(']')):
+            continue
+        field = key[6:-1]
+        if field not in model.numeric_fields:
+            raise APIException("Cannot filter range of " + field, status_code=400)
+        low, sep, high = value.partition(',')
+        if not sep:
+            raise APIException("range[%s] needs numbers: low,high" % field, status_code=400)
+        column = getattr(model, field + '_num')
+        if low.strip():
+            stmt = stmt.where(column >= _number(low, field))
+        if high.strip():
+            stmt = stmt.where(column <= _number(high, field))
+    return stmt
+
+def _histogram(rows, column, low, high, buckets):
+    if low == high:
+        count = db.session.scalar(db.select(db.func.count(column)).select_from(rows))
+        return [{"from": low, "to": high, "count": count}]
+    width = (high - low) / buckets
+    # floor((value - low) / width), the maximum itself goes in the last bucket. Casting
+    # alone truncates on SQLite but rounds on PostgreSQL.
+    index = db.cast(db.func.floor((column - low) / width), db.Integer)
+    bucket = db.case((index >= buckets, buckets - 1), else_=index).label('bucket')
+    counts = dict(db.session.execute(
+        db.select(bucket, db.func.count()).select_from(rows).where(column.is_not(None)).group_by(bucket)
+    ).all())
+    return [{"from": low + i * width, "to": low + (i + 1) * width, "count": counts.get(i, 0)}
+            for i in range(buckets)]
+
+def collection_stats(model):
+    fields = request.args.get('fields')
+    fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else list(model.numeric_fields)
+    unknown = [field for field in fields if field not in model.numeric_fields]
+    if unknown:
+        raise APIException("No statistics for: " + ", ".join(unknown), status_code=400)
+    buckets = request.args.get('buckets', 10, type=int)
+    if not 1 <= buckets <= current_app.config['STATS_MAX_BUCKETS']:
+        raise APIException("buckets must be between 1 and %d" % current_app.config['STATS_MAX_BUCKETS'],
+                           status_code=400)
+
+    # The filtered rows, reused by the aggregate and the histogram queries
+    columns = [getattr(model, field + '_num').label(field) for field in fields]
+    rows = apply_ranges(apply_filters(db.select(*columns), model), model).subquery()
+
+    aggregates = [db.func.count()]
+    for field in fields:
+        column = rows.c[field]
+        aggregates += [db.func.count(column), db.func.min(column), db.func.max(column), db.func.avg(column)]
+    row = db.session.execute(db.select(*aggregates).select_from(rows)).one()
+
+    result = {"count": row[0], "fields": {}}
+    for position, field in enumerate(fields):
+        count, low, high, avg = row[1 + position * 4: 5 + position * 4]
+        result["fields"][field] = {
+            "count": count,
+            "min": low,
+            "max": high,
+            "avg": float(avg) if avg is not None else None,
+            "histogram": _histogram(rows, rows.c[field], low, high, buckets) if count else [],
+        }
+    return result
@@ -1,4 +1,12 @@
-from flask import jsonify, url_for
+import base64
+import hashlib
+import json
+import re
+import sys
+from functools import wraps
+from flask import jsonify, url_for, request, current_app, Response, stream_with_context, g
+from models import db, get_versions, public_fields
+from serializers import row_serializer
 
 class APIException(Exception):
     status_code = 400
@@ -15,6 +23,239 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise APIException("Invalid cursor", status_code=400)
+    # Cursors issued before ?sort= existed only hold the id
+    if isinstance(values, int):
+        values = [values]
+    if not isinstance(values, list) or len(values) != size:
+        raise APIException("Invalid cursor", status_code=400)
+    # Sort key values are plain JSON scalars, anything else was tampered with
+    if not all(value is None or isinstance(value, (str, int, float, bool)) for value in values):
+        raise APIException("Invalid cursor", status_code=400)
+    return values
+
+def _convert(column, value):
+    python_type = column.type.python_type
+    if python_type is bool:
+        return value.lower() in ('1', 'true')
+    try:
+        return python_type(value)
+    except ValueError:
+        raise APIException("Invalid value for " + column.name, status_code=400)
+
+# Sorting: ?sort=name,-birth_year. The id is always the last key so the order is total.
+def sort_keys(model):
+    keys = []
+    for field in request.args.get('sort', '').split(','):
+        field = field.strip()
+        if not field:
+            continue
+        desc = field.startswith('-')
+        field = field.lstrip('-')
+        if field not in public_fields(model):
+            raise APIException("Cannot sort by " + field, status_code=400)
+        keys.append((field, desc))
+        if field == 'id':
+            return keys
+    keys.append(('id', False))
+    return keys
+
+def _order_by(model, keys):
+    clauses = []
+    for field, desc in keys:
+        column = getattr(model, field)
+        clause = column.desc() if desc else column.asc()
+        # Same NULL placement on every database, the keyset predicate relies on it
+        clauses.append(clause.nulls_last() if column.nullable else clause)
+    return clauses
+
+# Rows strictly after the cursor values in the (key1, key2, ..., id) order
+def _after(model, keys, values):
+    clauses, equal = [], []
+    for (field, desc), value in zip(keys, values):
+        column = getattr(model, field)
+        if value is None:
+            # NULLs sort last, nothing is strictly after a NULL in this column
+            same = column.is_(None)
+        else:
+            after = column < value if desc else column > value
+            if column.nullable:
+                after = db.or_(after, column.is_(None))
+            clauses.append(db.and_(*equal, after))
+            same = column == value
+        equal.append(same)
+    return db.or_(*clauses)
+
+def prefix_match(column, prefix):
+    if db.engine.dialect.name == 'postgresql':
+        # Served by the varchar_pattern_ops index
+        return column.startswith(prefix, autoescape=True)
+    # SQLite's LIKE is case-insensitive and can't use a plain index, a binary range can.
+    # The bound bumps the last character below U+10FFFF (skipping the surrogates,
+    # which can't be encoded); with none, the range is open-ended.
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return column >= prefix
+    upper = ord(stem[-1]) + 1
+    if 0xD800 <= upper <= 0xDFFF:
+        upper = 0xE000
+    return db.and_(column >= prefix, column < stem[:-1] + chr(upper))
+
+# Filtering: ?filter[gender]=female, ?filter[name]=Luke* for a prefix match
+def apply_filters(query, model):
+    for arg, value in request.args.items():
+        match = re.fullmatch(r'filter\[(\w+)\]', arg)
+        if not match:
+            continue
+        field = match.group(1)
+        if field not in public_fields(model):
+            raise APIException("Cannot filter by " + field, status_code=400)
+        column = getattr(model, field)
+        if value.endswith('*') and column.type.python_type is str:
+            if value[:-1]:
+                query = query.filter(prefix_match(column, value[:-1]))
+        else:
+            query = query.filter(column == _convert(column, value))
+    return query
+
+# Sparse fieldsets: ?fields=id,name. The id is always included because cursors need it.
+# Without ?fields= every public column is returned.
+def parse_fields(model):
+    raw = request.args.get('fields')
+    if not raw:
+        return public_fields(model)
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in public_fields(model)]
+    if unknown:
+        raise APIException("Unknown fields: " + ", ".join(unknown), status_code=400)
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+# ?fields= on responses that embed rows of several models (the favorites lists,
+# /search): each embedded row keeps the fields its model has, and every field must
+# belong to one of them. Returns the fields by model.
+def parse_embedded_fields(models):
+    raw = request.args.get('fields')
+    if not raw:
+        return {model: public_fields(model) for model in models}
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if not any(field in public_fields(model) for model in models)]
+    if unknown:
+        raise APIException("Unknown fields: " + ", ".join(unknown), status_code=400)
+    found = {}
+    for model in models:
+        found[model] = [field for field in fields if field in public_fields(model)]
+        if 'id' not in found[model]:
+            found[model].insert(0, 'id')
+    return found
+
+# Filtered select for a collection endpoint. It selects only the requested columns
+# (plus the sort keys, after them) and returns plain rows instead of ORM objects.
+def collection_query(model, fields):
+    columns = list(dict.fromkeys(fields + [field for field, desc in sort_keys(model)]))
+    stmt = db.select(*[getattr(model, column) for column in columns])
+    return apply_filters(stmt, model)
+
+def project(data, fields):
+    return {field: data[field] for field in fields}
+
+# Keyset pagination: ?limit=<n>&after=<cursor>. The cursor holds the sort key values
+# of the last row, so every page is an index range scan instead of an OFFSET.
+def page_select(stmt, model):
+    max_size = current_app.config['MAX_PAGE_SIZE']
+    limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    if limit < 1:
+        raise APIException("limit must be a positive integer", status_code=400)
+    limit = min(limit, max_size)
+
+    keys = sort_keys(model)
+    after = request.args.get('after')
+    if after:
+        stmt = stmt.filter(_after(model, keys, decode_cursor(after, len(keys))))
+
+    # Fetch one extra row to know if there is a next page without a COUNT(*)
+    return stmt.order_by(*_order_by(model, keys)).limit(limit + 1), keys, limit
+
+def finish_page(rows, keys, limit):
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        args = request.args.to_dict()
+        cursor = [getattr(rows[-1], field) for field, desc in keys]
+        args.update(limit=limit, after=encode_cursor(cursor))
+        next_url = url_for(request.endpoint, _external=True, **(request.view_args or {}), **args)
+    return rows, next_url
+
+def paginate(stmt, model):
+    stmt, keys, limit = page_select(stmt, model)
+    return finish_page(db.session.execute(stmt).all(), keys, limit)
+
+def wants_stream():
+    if request.args.get('stream') in ('1', 'true'):
+        return True
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+# Full-table export as NDJSON, one row per line. Rows are read in chunks through
+# a server-side cursor (yield_per) so memory does not grow with the table.
+# `encode` turns a batch of rows into JSON lines (see expand.row_encoder).
+def stream_collection(stmt, model, fields, encode=None):
+    batch_size = current_app.config['STREAM_BATCH_SIZE']
+    stmt = stmt.order_by(*_order_by(model, sort_keys(model))).execution_options(yield_per=batch_size)
+    if encode is None:
+        serialize = row_serializer(model, tuple(fields))
+        encode = lambda rows: [serialize(row) for row in rows]
+
+    def generate():
+        for rows in db.session.execute(stmt).partitions():
+            for line in encode(rows):
+                yield line + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# Conditional GET: the ETag is derived from the version of the tables the view reads,
+# so a 304 is answered with a single primary-key lookup and no rows are loaded.
+# If-None-Match compares weakly: compressed bodies carry the weak form (compression.py).
+def make_etag(tables, versions):
+    g.table_versions = dict(zip(tables, versions))
+    key = "%s|%s|%s|%s" % (tables, versions, request.full_path, wants_stream())
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def not_modified(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+# A table may also be given as a callable returning the extra tables this request
+# reads (see expand.expanded_tables)
+def conditional(*tables):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            names = []
+            for table in tables:
+                names += table() if callable(table) else [table]
+            names = tuple(dict.fromkeys(names))
+            etag = make_etag(names, get_versions(*names))
+            if request.if_none_match.contains_weak(etag):
+                return not_modified(etag)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            # A view may answer from an older version of the data (snapshots.py)
+            if response.status_code == 200 and not response.get_etag()[0]:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
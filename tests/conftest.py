@@ -0,0 +1,27 @@
+import os
+import sys
+
+# The app reads its configuration when it is imported: in-memory database, no
+# snapshot files, lean profile
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['SNAPSHOTS'] = '0'
+os.environ['APP_PROFILE'] = 'api'
+os.environ['ADMIN_LAZY'] = '0'
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pytest
+from app import create_app
+from models import db
+
+@pytest.fixture
+def app():
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,41 @@
+from models import db, People
+
+def add_people(*names):
+    db.session.add_all([People(name=name) for name in names])
+    db.session.commit()
+
+def test_create_rejects_nested_values(client):
+    response = client.post('/people', json=[
+        {"name": "Luke", "height": 172},
+        {"name": {"a": 1}},
+        {"name": "Leia", "mass": [49]},
+    ])
+    assert response.status_code == 207
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == [201, 400, 400]
+    assert results[1]['msg'] == "Invalid values: name"
+    assert results[2]['msg'] == "Invalid values: mass"
+    assert db.session.scalars(db.select(People.name)).all() == ['Luke']
+
+def test_update_rejects_nested_values(client):
+    add_people('Luke', 'Leia')
+    response = client.patch('/people', json=[
+        {"id": 1, "gender": "male"},
+        {"id": 2, "homeworld": {"name": "Alderaan"}},
+    ])
+    assert response.status_code == 207
+    assert [result['status'] for result in response.get_json()['results']] == [200, 400]
+    assert db.session.get(People, 2).homeworld is None
+
+def test_update_rejects_boolean_ids(client):
+    add_people('Luke')
+    response = client.patch('/people', json=[{"id": True, "name": "Vader"}])
+    assert response.status_code == 207
+    assert response.get_json()['results'][0]['status'] == 400
+    assert db.session.get(People, 1).name == 'Luke'
+
+def test_delete_rejects_boolean_ids(client):
+    add_people('Luke')
+    response = client.delete('/people', json={"ids": [True]})
+    assert response.status_code == 400
+    assert db.session.get(People, 1) is not None
@@ -0,0 +1,27 @@
+import pytest
+from app import create_app
+from models import db, People
+import cache
+
+@pytest.fixture
+def fresh_cache():
+    cache.set_backend(None)
+    yield
+    cache.set_backend(None)
+
+def test_cache_sized_from_config(monkeypatch, fresh_cache):
+    monkeypatch.setenv('ENTITY_CACHE_SIZE', '3')
+    monkeypatch.setenv('ENTITY_CACHE_TTL', '7')
+    app = create_app()
+    assert app.config['ENTITY_CACHE_SIZE'] == 3
+    with app.app_context():
+        db.create_all()
+        db.session.add(People(name='Luke'))
+        db.session.commit()
+        client = app.test_client()
+        assert client.get('/people/1').status_code == 200
+        assert client.get('/people/1').status_code == 200
+        stats = client.get('/cache/stats').get_json()
+        db.drop_all()
+    assert (stats['max_size'], stats['ttl']) == (3, 7)
+    assert (stats['hits'], stats['misses']) == (1, 1)
@@ -0,0 +1,21 @@
+from models import db, People, Planet
+from test_favorites_queries import add_favorites, count_statements
+
+# Only the expanded relations are fetched: one IN (...) each
+
+def test_expand_limits_queries(app, client):
+    add_favorites(10)
+    response, statements = count_statements(client, '/users/favorites?expand=planet')
+    # versions, favorites, planets
+    assert len(statements) == 3
+    assert all(favorite['people'] is None or favorite['people'].keys() == {'id'}
+               for favorite in response.get_json())
+
+def test_expand_homeworld(app, client):
+    db.session.add_all([Planet(name='Tatooine'), People(name='Luke', homeworld='Tatooine'),
+                        People(name='Leia', homeworld='Alderaan')])
+    db.session.commit()
+    response, _ = count_statements(client, '/people?expand=homeworld')
+    people = response.get_json()['results']
+    assert people[0]['homeworld']['name'] == 'Tatooine'
+    assert people[1]['homeworld'] is None
@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import event
+from models import db, User, People, Planet, Vehicle, Starship, Favorite
+
+# Listing favorites must cost the same number of statements whatever the number of
+# rows: the table versions, the favorites, and one IN (...) per embedded model.
+
+def add_favorites(count):
+    user = User(email='fan@example.com', password='secret', is_active=True)
+    db.session.add(user)
+    for i in range(count):
+        entities = [People(name='Person %d' % i), Planet(name='Planet %d' % i),
+                    Vehicle(name='Vehicle %d' % i), Starship(name='Starship %d' % i)]
+        db.session.add_all(entities)
+        db.session.flush()
+        for entity in entities:
+            db.session.add(Favorite(user=user, **{entity.__tablename__ + '_id': entity.id}))
+    db.session.commit()
+    return user.id
+
+def count_statements(client, url):
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    return response, statements
+
+@pytest.mark.parametrize('count', [1, 25])
+def test_all_favorites_query_count(app, client, count):
+    add_favorites(count)
+    response, statements = count_statements(client, '/users/favorites')
+    assert len(response.get_json()) == count * 4
+    # versions, favorites, people, planets, vehicles, starships
+    assert len(statements) == 6
+
+@pytest.mark.parametrize('count', [1, 25])
+def test_user_favorites_query_count(app, client, count):
+    user_id = add_favorites(count)
+    response, statements = count_statements(client, '/users/%d/favorites' % user_id)
+    favorites = response.get_json()
+    assert len(favorites) == count * 4
+    assert all(favorite['people'] or favorite['planet'] or favorite['vehicle'] or favorite['starship']
+               for favorite in favorites)
+    # versions, user, favorites, people, planets, vehicles, starships
+    assert len(statements) == 7
@@ -0,0 +1,28 @@
+from models import db, People, Planet, Vehicle
+from test_favorites_queries import add_favorites
+
+def test_favorites_fields(app, client):
+    user_id = add_favorites(1)
+    for url in ('/users/favorites?fields=name,climate', '/users/%d/favorites?fields=name,climate' % user_id):
+        favorites = client.get(url).get_json()
+        by_kind = {kind: favorite[kind] for favorite in favorites for kind in favorite
+                   if isinstance(favorite[kind], dict)}
+        assert by_kind['people'] == {'id': 1, 'name': 'Person 0'}
+        assert by_kind['planet'] == {'id': 1, 'name': 'Planet 0', 'climate': None}
+
+def test_favorites_unknown_field(app, client):
+    add_favorites(1)
+    response = client.get('/users/favorites?fields=name,nope')
+    assert response.status_code == 400
+    assert response.get_json()['message'] == "Unknown fields: nope"
+
+def test_search_fields(app, client):
+    db.session.add_all([People(name='Luke Skywalker', gender='male'), Planet(name='Skyhold', terrain='ice'),
+                        Vehicle(name='Skyhopper')])
+    db.session.commit()
+    results = client.get('/search?q=sky&fields=name,terrain').get_json()['results']
+    data = {result['resource']: result['data'] for result in results}
+    assert data['people'] == {'id': 1, 'name': 'Luke Skywalker'}
+    assert data['planet'] == {'id': 1, 'name': 'Skyhold', 'terrain': 'ice'}
+    assert data['vehicle'] == {'id': 1, 'name': 'Skyhopper'}
+    assert client.get('/search?q=sky&fields=nope').status_code == 400
@@ -0,0 +1,19 @@
+import sys
+import pytest
+from models import db, People
+
+LAST = chr(sys.maxunicode)
+
+@pytest.mark.parametrize('prefix, expected', [
+    ('Lu', ['Luke']),
+    ('L' + LAST, ['L' + LAST + 'x']),
+    (LAST, [LAST, LAST + 'y']),
+    ('\ud7ff', ['\ud7ffz']),
+])
+def test_prefix_filter(client, prefix, expected):
+    db.session.add_all([People(name=name) for name in
+                        ['Luke', 'Lz', 'L' + LAST + 'x', LAST, LAST + 'y', '\ud7ffz', '\ue000']])
+    db.session.commit()
+    response = client.get('/people', query_string={'filter[name]': prefix + '*'})
+    assert response.status_code == 200
+    assert [person['name'] for person in response.get_json()['results']] == expected
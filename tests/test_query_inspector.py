@@ -0,0 +1,29 @@
+from flask import g
+from app import create_app
+from models import db, People
+
+# The listeners are registered once per process: building more apps must not make a
+# statement count twice (or trip the N+1 check on a single lookup)
+
+def test_single_lookup_counts_once_across_apps(monkeypatch):
+    monkeypatch.setenv('SQL_INSTRUMENTATION', '1')
+    monkeypatch.setenv('N_PLUS_ONE_THRESHOLD', '1')
+    monkeypatch.setenv('N_PLUS_ONE_RAISE', '1')
+    for _ in range(4):
+        app = create_app()
+        counts = {}
+
+        @app.after_request
+        def capture(response):
+            counts.update(g.get('statement_counts', {}))
+            return response
+
+        with app.app_context():
+            db.create_all()
+            db.session.add(People(name='Luke'))
+            db.session.commit()
+            response = app.test_client().get('/people/1')
+            assert response.status_code == 200
+            assert counts and max(counts.values()) == 1
+            db.session.remove()
+            db.drop_all()
@@ -0,0 +1,32 @@
+import os
+from app import create_app
+from models import db, People
+import snapshots
+
+def make_app(monkeypatch, tmp_path):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///' + str(tmp_path / 'db.sqlite'))
+    monkeypatch.setenv('SNAPSHOTS', '1')
+    monkeypatch.setenv('SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    return create_app()
+
+# Workers share the directory: one starting up leaves the other's files alone
+def test_workers_keep_each_others_snapshots(monkeypatch, tmp_path):
+    first = make_app(monkeypatch, tmp_path)
+    with first.app_context():
+        db.create_all()
+        db.session.add(People(name='Luke'))
+        db.session.commit()
+        version = snapshots.build(People)
+        path = snapshots._path('people', version)
+    assert os.path.exists(path)
+
+    second = make_app(monkeypatch, tmp_path)
+    with second.app_context():
+        assert snapshots._path('people', version) == path
+    response = second.test_client().get('/people?stream=1', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert os.path.exists(path)
+
+    with first.app_context():
+        db.drop_all()